@@ -1,4 +1,3 @@
-import requests
 import uuid
 from datetime import datetime
 from fastapi import Request, HTTPException
@@ -7,12 +6,16 @@ from typing import Dict, Any
 
 from config import *
 from models import *
+from graph import graph_get
+from log import get_logger
+
+logger = get_logger("auth")
 
 def generate_oauth_url(client_id: str) -> str:
     """Generate Facebook OAuth URL for client"""
     state = f"{client_id}_{uuid.uuid4().hex}"
     oauth_url = get_oauth_url(client_id, state)
-    print(f"\n🔗 Direct Facebook OAuth URL for {client_id}: {oauth_url}")
+    logger.info("OAuth URL generated", extra={"client_id": client_id, "oauth_url": oauth_url})
     return oauth_url
 
 async def handle_oauth_callback(request: Request) -> Dict[str, Any]:
@@ -21,19 +24,18 @@ async def handle_oauth_callback(request: Request) -> Dict[str, Any]:
     state = request.query_params.get("state")
     error = request.query_params.get("error")
     
-    print("\n📥 Callback received from Facebook")
+    logger.info("OAuth callback received")
     
     if error:
-        print(f"❌ Error: {error}")
+        logger.warning("OAuth authorization failed", extra={"error": error})
         return {"error": f"Facebook authorization failed: {error}"}
     
     if not code or not state:
-        print("❌ Missing code or state")
+        logger.warning("OAuth callback missing code or state")
         return {"error": "Missing code or state parameter"}
     
     # Extract client_id from state
     client_id = state.split("_")[0]
-    print(f"👤 Client ID: {client_id}")
     
     # Exchange code for access token
     access_token = await exchange_code_for_token(code)
@@ -55,12 +57,13 @@ async def handle_oauth_callback(request: Request) -> Dict[str, Any]:
     )
     store_client_token(client_id, client_token)
     
-    print(f"✅ Token stored for client {client_id}")
-    print(f"👤 Profile: {profile}")
-    print(f"📄 Pages: {len(pages_data)} pages found")
+    logger.info(
+        "Token stored",
+        extra={"client_id": client_id, "profile_id": profile.id, "pages": len(pages_data)}
+    )
     
-    # Print page links
-    print_page_links(pages_data)
+    # Log page links
+    log_page_links(pages_data)
     
     return {
         "message": "🎉 Facebook connected successfully!",
@@ -74,18 +77,19 @@ async def handle_oauth_callback(request: Request) -> Dict[str, Any]:
 
 async def exchange_code_for_token(code: str) -> Optional[str]:
     """Exchange authorization code for access token"""
-    print("🔄 Exchanging code for access token...")
-    
-    token_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/oauth/access_token?"
-        f"client_id={FACEBOOK_APP_ID}&"
-        f"redirect_uri={REDIRECT_URI}&"
-        f"client_secret={FACEBOOK_APP_SECRET}&"
-        f"code={code}"
+    
+    token_response = await graph_get(
+        "/oauth/access_token",
+        params={
+            "client_id": FACEBOOK_APP_ID,
+            "redirect_uri": REDIRECT_URI,
+            "client_secret": FACEBOOK_APP_SECRET,
+            "code": code
+        }
     )
     
     if token_response.status_code != 200:
-        print(f"❌ Token exchange failed: {token_response.text}")
+        logger.error("Token exchange failed", extra={"details": token_response.text})
         return None
     
     token_data = token_response.json()
@@ -93,8 +97,8 @@ async def exchange_code_for_token(code: str) -> Optional[str]:
 
 async def get_user_profile(access_token: str) -> FacebookProfile:
     """Get user profile information"""
-    profile_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/me?fields=id,name,email&access_token={access_token}"
+    profile_response = await graph_get(
+        "/me", params={"fields": "id,name,email", "access_token": access_token}
     )
     
     if profile_response.status_code == 200:
@@ -108,8 +112,8 @@ async def get_user_profile(access_token: str) -> FacebookProfile:
 
 async def get_user_pages(access_token: str, client_id: str) -> List[FacebookPage]:
     """Get user's Facebook pages"""
-    pages_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/me/accounts?access_token={access_token}"
+    pages_response = await graph_get(
+        "/me/accounts", params={"access_token": access_token}
     )
     
     pages_data = []
@@ -136,14 +140,17 @@ async def get_user_pages(access_token: str, client_id: str) -> List[FacebookPage
     
     return pages_data
 
-def print_page_links(pages_data: List[FacebookPage]):
-    """Print direct page message links"""
-    print("\n📱 DIRECT PAGE MESSAGE LINKS:")
-    print("=" * 80)
+def log_page_links(pages_data: List[FacebookPage]):
+    """Log direct page message links"""
     for page in pages_data:
-        print(f"📄 Page: {page.name} ({page.id})")
-        print(f" 📥 Get Messages: http://localhost:8000/messages/{page.id}")
-        print(f" 📝 Get Conversations: http://localhost:8000/conversations/{page.id}")
-        print(f" 📤 Send Message: http://localhost:8000/messages/{page.id}/send")
-        print(f" 🔍 Debug Page: http://localhost:8000/debug/{page.id}")
-        print("-" * 80)
+        logger.info(
+            "Page connected",
+            extra={
+                "page_id": page.id,
+                "page_name": page.name,
+                "messages_url": f"http://localhost:8000/messages/{page.id}",
+                "conversations_url": f"http://localhost:8000/conversations/{page.id}",
+                "send_url": f"http://localhost:8000/messages/{page.id}/send",
+                "debug_url": f"http://localhost:8000/debug/{page.id}"
+            }
+        )
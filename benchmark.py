@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+import httpx
+from datetime import datetime
+from typing import Dict, List, Any, Callable, Awaitable, Optional
+
+from config import HOST, PORT
+
+# Where each run's results are written, one JSON file per run
+RESULTS_DIR = "bench_results"
+
+SCENARIOS = ["conversations", "messages", "leads", "webhook", "send"]
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+async def connect(client: httpx.AsyncClient) -> Dict[str, Any]:
+    """Connect a benchmark client through the OAuth callback and return its pages
+    
+    The server must be pointed at a Graph stand-in such as fakegraph.py,
+    which accepts any authorization code.
+    """
+    response = await client.get(
+        "/auth/facebook/callback", params={"code": "bench", "state": f"bench_{uuid.uuid4().hex}"}
+    )
+    body = response.json()
+    if response.status_code != 200 or not body.get("pages"):
+        raise SystemExit(f"Could not connect the benchmark client: {response.status_code} {response.text}")
+    return {"client_id": body["client_id"], "page_id": body["pages"][0]["id"]}
+
+def build_scenarios(client_id: str, page_id: str) -> Dict[str, Scenario]:
+    """Build one request function per benchmarked endpoint"""
+    def webhook_payload(i: int) -> Dict[str, Any]:
+        now = int(time.time() * 1000)
+        return {
+            "object": "page",
+            "entry": [{
+                "id": page_id,
+                "time": now,
+                "messaging": [{
+                    "sender": {"id": f"{page_id}{i % 100:06d}"},
+                    "recipient": {"id": page_id},
+                    "timestamp": now,
+                    "message": {"mid": f"m_bench_{uuid.uuid4().hex}", "text": f"Benchmark message {i}"}
+                }]
+            }]
+        }
+    
+    return {
+        "conversations": lambda client, i: client.get(f"/conversations/{page_id}"),
+        "messages": lambda client, i: client.get(f"/messages/{page_id}"),
+        "leads": lambda client, i: client.get(f"/leads/{client_id}"),
+        "webhook": lambda client, i: client.post("/webhook", json=webhook_payload(i)),
+        "send": lambda client, i: client.post(
+            f"/messages/{page_id}/send",
+            json={"recipient_id": f"{page_id}{i % 100:06d}", "message": f"Benchmark reply {i}"}
+        )
+    }
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    """Get the nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(share * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, total: int) -> Dict[str, Any]:
+    """Send total requests with concurrency in flight and summarise their latency"""
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await scenario(client, i)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0
+    }
+
+def print_results(results: Dict[str, List[Dict[str, Any]]], baseline: Optional[Dict[str, Any]] = None):
+    """Print a results table, with changes against a baseline run when given"""
+    print(f"{'scenario':<14}{'conc':>6}{'rps':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}  vs baseline")
+    for name, levels in results.items():
+        previous = {
+            level["concurrency"]: level
+            for level in (baseline or {}).get("results", {}).get(name, [])
+        }
+        for level in levels:
+            line = (
+                f"{name:<14}{level['concurrency']:>6}{level['rps']:>10}{level['p50_ms']:>10}"
+                f"{level['p90_ms']:>10}{level['p99_ms']:>10}{level['errors']:>8}"
+            )
+            before = previous.get(level["concurrency"])
+            if before and before["rps"] and before["p99_ms"]:
+                line += (
+                    f"  rps {(level['rps'] / before['rps'] - 1) * 100:+.0f}%"
+                    f", p99 {(level['p99_ms'] / before['p99_ms'] - 1) * 100:+.0f}%"
+                )
+            print(line)
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run every selected scenario at every concurrency level"""
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(concurrency_levels), max_keepalive_connections=max(concurrency_levels))
+    
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        ready = await client.get("/health/ready")
+        if ready.status_code != 200:
+            raise SystemExit(f"Server at {args.url} is not ready: {ready.text}")
+        
+        ids = await connect(client)
+        scenarios = build_scenarios(ids["client_id"], ids["page_id"])
+        
+        results: Dict[str, List[Dict[str, Any]]] = {}
+        for name in args.scenarios.split(","):
+            scenario = scenarios[name]
+            # Warm up caches and the local store so levels are comparable
+            await run_level(client, scenario, 1, args.warmup)
+            results[name] = []
+            for concurrency in concurrency_levels:
+                level = await run_level(client, scenario, concurrency, args.requests)
+                results[name].append(level)
+                print(f"{name} @ {concurrency}: {level['rps']} req/s, p50 {level['p50_ms']} ms, p99 {level['p99_ms']} ms")
+    
+    return {
+        "label": args.label,
+        "url": args.url,
+        "started_at": datetime.now().isoformat(),
+        "requests_per_level": args.requests,
+        "results": results
+    }
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Measure throughput and latency of the CRM endpoints")
+    parser.add_argument("--url", default=f"http://{HOST}:{PORT}", help="Base URL of a running CRM server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, from {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--label", default="", help="Name stored with the results")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+    
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    run = asyncio.run(run_benchmark(args))
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print()
+    print_results(run["results"], baseline)
+    
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}{'-' + args.label if args.label else ''}.json")
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults saved to {path}")
@@ -0,0 +1,91 @@
+import time
+from typing import Dict, Any
+
+from config import GRAPH_BREAKER_FAILURE_THRESHOLD, GRAPH_BREAKER_RESET_TIMEOUT
+from metrics import Callback
+from log import get_logger
+
+logger = get_logger("breaker")
+
+# Numeric values of the states for the graph_circuit_state gauge
+STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+class CircuitBreaker:
+    """Refuse calls to a failing dependency until it has had time to recover
+    
+    Closed, calls go through and failure_threshold consecutive failures
+    open the circuit. Open, calls are refused until reset_timeout has
+    passed; then a single trial call is let through (half open), and its
+    success closes the circuit while its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """Check whether a call may go through now, claiming the trial call when half open"""
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.trial_in_flight = False
+        if self.state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        self.rejected += 1
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through"""
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info("Circuit closed", extra={"circuit": self.name})
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+                logger.warning("Circuit opened", extra={"circuit": self.name, "failures": self.failures})
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def record_abandoned(self):
+        """Release the trial call of a call that ended without telling success from failure"""
+        self.trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 1),
+            "opened": self.opened,
+            "rejected": self.rejected
+        }
+
+graph_breaker = CircuitBreaker("graph", GRAPH_BREAKER_FAILURE_THRESHOLD, GRAPH_BREAKER_RESET_TIMEOUT)
+
+Callback("graph_circuit_state", "Graph circuit breaker state: 0 closed, 1 half open, 2 open", lambda: STATE_VALUES[graph_breaker.state])
+Callback(
+    "graph_circuit_events_total",
+    "Times the Graph circuit opened, and calls it refused",
+    lambda: {(event,): getattr(graph_breaker, event) for event in ("opened", "rejected")},
+    labelnames=("event",),
+    kind="counter"
+)
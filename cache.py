@@ -0,0 +1,122 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Optional, Set
+
+from config import GRAPH_CACHE_MAX_ENTRIES, GRAPH_CACHE_MAX_BYTES
+from metrics import Callback
+
+class ResponseCache:
+    """Bounded TTL + LRU cache with tag-based invalidation
+    
+    Entries expire after their own TTL and the least recently used ones
+    are evicted once the entry count or total size exceeds its limits.
+    Each entry may carry a tag (e.g. a page_id) so that everything cached
+    for that tag can be dropped at once.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a live entry, marking it as recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        if entry["expires_at"] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["value"]
+
+    def set(self, key: Hashable, value: Any, ttl: float, size: int, tag: Optional[str] = None):
+        """Store an entry, evicting least recently used ones to stay within limits"""
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        
+        self._entries[key] = {
+            "value": value,
+            "expires_at": time.monotonic() + ttl,
+            "size": size,
+            "tag": tag
+        }
+        self.total_bytes += size
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+        
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate_tag(self, tag: str) -> int:
+        """Drop every entry cached under a tag"""
+        keys = self._tags.pop(tag, set())
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+        self._tags.clear()
+        self.total_bytes = 0
+
+    def _remove(self, key: Hashable):
+        """Remove an entry and its tag reference"""
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["size"]
+        tag = entry["tag"]
+        if tag is not None and tag in self._tags:
+            self._tags[tag].discard(key)
+            if not self._tags[tag]:
+                del self._tags[tag]
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache size and counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+# Cache of Graph GET responses, shared by all requests in this process
+graph_cache = ResponseCache(GRAPH_CACHE_MAX_ENTRIES, GRAPH_CACHE_MAX_BYTES)
+
+Callback("graph_cache_entries", "Entries in the Graph response cache", lambda: len(graph_cache._entries))
+Callback("graph_cache_bytes", "Bytes held by the Graph response cache", lambda: graph_cache.total_bytes)
+Callback(
+    "graph_cache_events_total",
+    "Graph response cache lookups and removals, by event",
+    lambda: {
+        (event,): getattr(graph_cache, event)
+        for event in ("hits", "misses", "evictions", "expirations", "invalidations")
+    },
+    labelnames=("event",),
+    kind="counter"
+)
@@ -7,15 +7,106 @@ FACEBOOK_APP_SECRET = ""
 REDIRECT_URI = "http://localhost:8000/auth/facebook/callback"
 WEBHOOK_VERIFY_TOKEN = "crmsecret123"
 
+# Webhook ingestion queue
+WEBHOOK_QUEUE_SIZE = 10000
+WEBHOOK_WORKERS = 4
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_ENQUEUE_TIMEOUT = 2.0  # seconds to wait for room before answering 503
+
+# Live event push (SSE / WebSocket), per worker process
+LIVE_ENABLED = True  # serve /live; serve mode then refuses more than one worker
+LIVE_QUEUE_SIZE = 256  # buffered events per subscriber before it is dropped as too slow
+LIVE_MAX_SUBSCRIBERS = 1000
+LIVE_HEARTBEAT_INTERVAL = 15.0  # seconds between keep-alives on idle streams
+
+# Read endpoint responses
+RESPONSE_COMPRESS_MIN_BYTES = 1024  # smaller bodies are sent uncompressed
+RESPONSE_GZIP_LEVEL = 5
+RESPONSE_BROTLI_QUALITY = 4  # used only when the optional brotli package is installed
+
+# Logging
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"  # "json" or "text"
+LOG_PAYLOADS = False  # Log full webhook and debug payloads at DEBUG level
+LOG_WEBHOOK_SAMPLE_RATE = 0.1  # Share of per-message webhook logs kept
+
 # Server configuration
 HOST = "127.0.0.1"
 PORT = 8000
+SERVER_WORKERS = 1  # worker processes in serve mode
+SERVER_GRACEFUL_TIMEOUT = 30  # seconds to drain sends and webhooks on shutdown
+SERVER_DRAIN_DELAY = 5.0  # seconds /health/ready reports draining before the listening socket closes
+SERVER_READY_TIMEOUT = 30.0  # seconds the terminal waits for the server to be ready
+TERMINAL_REQUEST_TIMEOUT = 60.0  # seconds the terminal waits for an API response
+
+# Outbound send scheduler, paced per page
+SEND_RATE_PER_SECOND = 10.0
+SEND_BURST = 20
+SEND_MAX_IN_FLIGHT_PER_PAGE = 10
+SEND_QUEUE_LIMIT_PER_PAGE = 1000
+SEND_MAX_ATTEMPTS = 5
+SEND_RETRY_BASE_DELAY = 1.0  # seconds, doubled on each retry
+SEND_RETRY_MAX_DELAY = 60.0
+SEND_JOB_HISTORY = 10000  # finished jobs kept for polling
+SEND_BULK_MAX_RECIPIENTS = 10000
+SEND_BULK_CONCURRENCY = 50  # bulk sends queued at once per request
+
+# Leads fetched when a leadgen webhook arrives
+LEADGEN_MAX_ATTEMPTS = 5
+LEADGEN_RETRY_BASE_DELAY = 1.0  # seconds, doubled on each retry
+LEADGEN_RETRY_MAX_DELAY = 30.0
+
+# Graph usage budget; callers slow down above the threshold (percent)
+USAGE_SLOWDOWN_THRESHOLD = 75
+USAGE_MAX_DELAY = 30.0  # seconds
+USAGE_STALE_AFTER = 300  # seconds before recorded usage is ignored
+
+# Local message store (SQLite, WAL mode)
+STORE_PATH = "crm_store.db"
+
+# Token store: "sqlite" persists tokens and shares them between workers
+TOKEN_STORE_BACKEND = "sqlite"  # or "memory"
+TOKEN_STORE_PATH = "crm_tokens.db"
+TOKEN_CACHE_TTL = 30.0  # seconds a worker trusts its cached copy of a token
 
 # Facebook API configuration
 FACEBOOK_API_VERSION = "v18.0"
-FACEBOOK_GRAPH_URL = f"https://graph.facebook.com/{FACEBOOK_API_VERSION}"
+# Override to point at a stand-in such as fakegraph.py, e.g. http://127.0.0.1:8100/v18.0
+FACEBOOK_GRAPH_URL = os.getenv("FACEBOOK_GRAPH_URL", f"https://graph.facebook.com/{FACEBOOK_API_VERSION}")
 FACEBOOK_OAUTH_URL = f"https://www.facebook.com/{FACEBOOK_API_VERSION}/dialog/oauth"
 
+# Graph API HTTP client configuration
+GRAPH_HTTP2 = True  # Used only when the optional h2 package is installed
+GRAPH_MAX_CONNECTIONS = 100
+GRAPH_MAX_KEEPALIVE_CONNECTIONS = 20
+GRAPH_KEEPALIVE_EXPIRY = 30.0  # seconds
+GRAPH_FANOUT_CONCURRENCY = 10  # Concurrent fan-out calls per page token
+GRAPH_BATCH_SIZE = 50  # Graph Batch API limit of sub-requests per call
+GRAPH_MAX_PAGE_SIZE = 100  # Largest limit= callers may pass through to Graph
+MESSAGE_PAGE_SIZE = 50  # Default messages fetched per conversation
+
+# Graph call timeouts in seconds; read timeouts keyed by endpoint template
+GRAPH_CONNECT_TIMEOUT = 3.0
+GRAPH_DEFAULT_TIMEOUT = 10.0
+GRAPH_TIMEOUTS = {
+    "/": 30.0,  # Batch API calls carry up to GRAPH_BATCH_SIZE sub-requests
+    "/me/messages": 20.0,
+    "/{id}/leads": 15.0,
+}
+GRAPH_REQUEST_DEADLINE = 25.0  # seconds one API request may spend on Graph calls
+GRAPH_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failed calls that open the circuit
+GRAPH_BREAKER_RESET_TIMEOUT = 30.0  # seconds the circuit stays open before a trial call
+GRAPH_HEDGE_DELAY = None  # seconds before a slow GET is sent again; None disables hedging
+
+# Graph GET response cache, TTLs in seconds keyed by endpoint template
+GRAPH_CACHE_MAX_ENTRIES = 2000
+GRAPH_CACHE_MAX_BYTES = 32 * 1024 * 1024
+GRAPH_CACHE_DEFAULT_TTL = 60
+GRAPH_CACHE_TTLS = {
+    "/{id}": 300,
+    "/me/permissions": 300,
+}
+
 # OAuth scopes
 FACEBOOK_SCOPES = [
     "pages_messaging",
@@ -0,0 +1,29 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Monotonic time by which the current API request's Graph calls must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("graph_deadline", default=None)
+
+@contextmanager
+def graph_deadline(seconds: float) -> Iterator[None]:
+    """Give the Graph calls made inside the block, concurrent ones included, seconds in total
+    
+    Calls still running at the deadline are cancelled and later ones fail
+    at once, both with GraphDeadlineExceeded. Usage throttle pauses are
+    cut short at the deadline. An enclosing deadline that ends sooner
+    still applies.
+    """
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
@@ -1,10 +1,13 @@
-import json
-import requests
+import logging
 from typing import Dict, Any
 
-from config import FACEBOOK_GRAPH_URL
+from config import LOG_PAYLOADS
+from graph import graph_get
+from log import get_logger
 from models import get_page_token, page_exists
 
+logger = get_logger("debug")
+
 async def debug_page_setup(page_id: str) -> Dict[str, Any]:
     """Debug page messaging setup"""
     if not page_exists(page_id):
@@ -14,18 +17,27 @@ async def debug_page_setup(page_id: str) -> Dict[str, Any]:
     page_access_token = page_token["access_token"]
     
     # Test page access
-    page_info = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/{page_id}?fields=name,id&access_token={page_access_token}"
+    page_info = await graph_get(
+        f"/{page_id}",
+        params={"fields": "name,id", "access_token": page_access_token},
+        owner_id=page_id,
+        cache=True
     )
     
     # Test permissions
-    permissions = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/me/permissions?access_token={page_access_token}"
+    permissions = await graph_get(
+        "/me/permissions",
+        params={"access_token": page_access_token},
+        owner_id=page_id,
+        cache=True
     )
     
     # Test messaging features
-    page_messaging_test = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/{page_id}?fields=name,messaging_feature_status&access_token={page_access_token}"
+    page_messaging_test = await graph_get(
+        f"/{page_id}",
+        params={"fields": "name,messaging_feature_status", "access_token": page_access_token},
+        owner_id=page_id,
+        cache=True
     )
     
     debug_info = {
@@ -37,7 +49,8 @@ async def debug_page_setup(page_id: str) -> Dict[str, Any]:
         "messaging_status": page_messaging_test.json() if page_messaging_test.status_code == 200 else {"error": page_messaging_test.text}
     }
     
-    print(f"🔍 Debug info for page {page_id}:")
-    print(json.dumps(debug_info, indent=2))
+    logger.info("Page debug info collected", extra={"page_id": page_id})
+    if LOG_PAYLOADS and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Page debug payload", extra={"page_id": page_id, "payload": debug_info})
     
     return debug_info
@@ -0,0 +1,278 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uvicorn
+from datetime import datetime, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from urllib.parse import urlencode, urlsplit, parse_qsl
+
+# Data volumes, latency and fault injection; override from the command line
+settings: Dict[str, Any] = {
+    "pages": 3,
+    "conversations": 200,  # per page
+    "messages": 20,  # per conversation
+    "ad_accounts": 2,
+    "forms": 3,  # per ad account
+    "leads": 500,  # per form
+    "latency_ms": 30.0,  # median response latency
+    "latency_sigma": 0.5,  # spread of the log-normal latency distribution
+    "error_rate": 0.0,  # share of requests answered with a transient 500
+    "throttle_rate": 0.0,  # share of requests answered with a rate limit error
+    "usage_percent": 0,  # call_count reported in X-App-Usage
+    "max_page_size": 100
+}
+
+# Timestamps count back from when the server started, newest first
+BASE_TIME = int(time.time())
+
+fake_stats = {"requests": 0, "errors": 0, "throttled": 0, "batch_calls": 0}
+
+app = FastAPI()
+
+def graph_time(timestamp: float) -> str:
+    """Format a Unix timestamp the way Graph does"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+def graph_error(status_code: int, message: str, code: int, is_transient: bool = False) -> Tuple[int, Dict[str, Any]]:
+    """Build a Graph-shaped error response"""
+    return status_code, {
+        "error": {
+            "message": message,
+            "type": "OAuthException",
+            "code": code,
+            "is_transient": is_transient,
+            "fbtrace_id": f"fake{random.getrandbits(32):08x}"
+        }
+    }
+
+def page_ids() -> List[str]:
+    return [str(100000 + i) for i in range(settings["pages"])]
+
+def page(page_id: str) -> Dict[str, Any]:
+    return {
+        "id": page_id,
+        "name": f"Fake Page {page_id}",
+        "access_token": f"page_token_{page_id}",
+        "category": "Software",
+        "tasks": ["MESSAGING", "MANAGE"]
+    }
+
+def psid(page_id: str, index: int) -> str:
+    return f"{page_id}{index:06d}"
+
+def conversation(page_id: str, index: int) -> Dict[str, Any]:
+    return {
+        "id": f"t_{page_id}_{index}",
+        "updated_time": graph_time(BASE_TIME - index * 60),
+        "message_count": settings["messages"],
+        "unread_count": index % 3,
+        "participants": {
+            "data": [
+                {"id": psid(page_id, index), "name": f"Customer {index}", "email": f"{psid(page_id, index)}@facebook.com"},
+                {"id": page_id, "name": f"Fake Page {page_id}"}
+            ]
+        }
+    }
+
+def message(page_id: str, conversation_index: int, index: int) -> Dict[str, Any]:
+    customer = {"id": psid(page_id, conversation_index), "name": f"Customer {conversation_index}"}
+    page_sender = {"id": page_id, "name": f"Fake Page {page_id}"}
+    from_data, to_data = (customer, page_sender) if index % 2 else (page_sender, customer)
+    return {
+        "id": f"m_{page_id}_{conversation_index}_{index}",
+        "created_time": graph_time(BASE_TIME - conversation_index * 60 - index * 10),
+        "from": from_data,
+        "to": {"data": [to_data]},
+        "message": f"Message {index} in conversation {conversation_index}"
+    }
+
+def ad_account_ids() -> List[str]:
+    return [f"act_{300000 + i}" for i in range(settings["ad_accounts"])]
+
+def form_ids(account_id: str) -> List[str]:
+    account_index = int(account_id[len("act_"):]) - 300000
+    return [str(400000 + account_index * 100 + i) for i in range(settings["forms"])]
+
+def lead_time(index: int) -> int:
+    return BASE_TIME - index * 300
+
+def lead(form_id: str, index: int) -> Dict[str, Any]:
+    return {
+        "id": f"{form_id}{index:06d}",
+        "created_time": graph_time(lead_time(index)),
+        "form_id": form_id,
+        "field_data": [
+            {"name": "full_name", "values": [f"Lead {index}"]},
+            {"name": "email", "values": [f"lead{index}.{form_id}@example.com"]}
+        ]
+    }
+
+def lead_count(form_id: str, params: Dict[str, str]) -> int:
+    """Count a form's leads, honouring a time_created GREATER_THAN filter"""
+    total = settings["leads"]
+    try:
+        filters = json.loads(params.get("filtering", "[]"))
+    except ValueError:
+        filters = []
+    for rule in filters:
+        if rule.get("field") == "time_created" and rule.get("operator") == "GREATER_THAN":
+            # lead_time(index) > value  <=>  index < (BASE_TIME - value) / 300
+            newer = -(-(BASE_TIME - int(rule.get("value", 0))) // 300)
+            total = max(0, min(total, newer))
+    return total
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        return 0
+
+def paginate(path: str, params: Dict[str, str], total: int, item: Callable[[int], Dict[str, Any]]) -> Dict[str, Any]:
+    """Serve one cursor-paginated page of an edge with total items"""
+    limit = max(1, min(int(params.get("limit", 25)), settings["max_page_size"]))
+    offset = decode_cursor(params.get("after"))
+    end = min(offset + limit, total)
+    body: Dict[str, Any] = {"data": [item(index) for index in range(offset, end)]}
+    
+    if offset < end:
+        body["paging"] = {"cursors": {"before": encode_cursor(offset), "after": encode_cursor(end)}}
+        if end < total:
+            next_params = {**params, "after": encode_cursor(end)}
+            body["paging"]["next"] = f"https://graph.facebook.com/v18.0/{path}?{urlencode(next_params)}"
+    return body
+
+def resolve(method: str, path: str, params: Dict[str, str], body: Any) -> Tuple[int, Dict[str, Any]]:
+    """Answer one Graph call"""
+    parts = [part for part in path.strip("/").split("/") if part]
+    
+    if method == "POST":
+        if parts == ["me", "messages"]:
+            recipient = (body or {}).get("recipient", {}).get("id") if isinstance(body, dict) else None
+            if not recipient:
+                return graph_error(400, "(#100) The parameter recipient is required", 100)
+            return 200, {"recipient_id": recipient, "message_id": f"m_sent_{random.getrandbits(64):016x}"}
+        return graph_error(400, f"Unsupported post request: {path}", 100)
+    
+    if parts == ["oauth", "access_token"]:
+        return 200, {"access_token": "fake_user_token", "token_type": "bearer", "expires_in": 5183944}
+    if parts == ["me"]:
+        return 200, {"id": "500000", "name": "Fake User", "email": "fake.user@example.com"}
+    if parts == ["me", "accounts"]:
+        pages = page_ids()
+        return 200, paginate(path, params, len(pages), lambda i: page(pages[i]))
+    if parts == ["me", "permissions"]:
+        return 200, {"data": [{"permission": name, "status": "granted"} for name in ("pages_messaging", "leads_retrieval")]}
+    if parts == ["me", "adaccounts"]:
+        accounts = ad_account_ids()
+        return 200, paginate(path, params, len(accounts), lambda i: {"id": accounts[i], "account_id": accounts[i][4:]})
+    
+    if len(parts) == 2:
+        object_id, edge = parts
+        if edge == "conversations" and object_id in page_ids():
+            return 200, paginate(path, params, settings["conversations"], lambda i: conversation(object_id, i))
+        if edge == "messages" and object_id.startswith("t_"):
+            _, page_id, index = object_id.split("_", 2)
+            if page_id in page_ids() and index.isdigit() and int(index) < settings["conversations"]:
+                return 200, paginate(path, params, settings["messages"], lambda i: message(page_id, int(index), i))
+        if edge == "leadgen_forms" and object_id in ad_account_ids():
+            forms = form_ids(object_id)
+            return 200, paginate(path, params, len(forms), lambda i: {"id": forms[i], "name": f"Form {forms[i]}", "status": "ACTIVE"})
+        if edge == "leads" and any(object_id in form_ids(account) for account in ad_account_ids()):
+            return 200, paginate(path, params, lead_count(object_id, params), lambda i: lead(object_id, i))
+    
+    if len(parts) == 1:
+        object_id = parts[0]
+        if object_id in page_ids():
+            return 200, {**page(object_id), "messaging_feature_status": {"hop_v2": True}}
+        form_id, index = object_id[:6], object_id[6:]
+        if index.isdigit() and any(form_id in form_ids(account) for account in ad_account_ids()):
+            if int(index) < settings["leads"]:
+                return 200, lead(form_id, int(index))
+    
+    return graph_error(404, f"Unsupported get request. Object with ID '{path}' does not exist", 100)
+
+def inject_fault() -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Fail a call at the configured error and throttle rates"""
+    roll = random.random()
+    if roll < settings["error_rate"]:
+        fake_stats["errors"] += 1
+        return graph_error(500, "An unexpected error has occurred. Please retry your request later.", 2, True)
+    if roll < settings["error_rate"] + settings["throttle_rate"]:
+        fake_stats["throttled"] += 1
+        return graph_error(400, "(#4) Application request limit reached", 4, True)
+    return None
+
+def run_batch(form: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Answer every sub-request of a Graph batch call"""
+    fake_stats["batch_calls"] += 1
+    results = []
+    for sub_request in json.loads(form.get("batch", "[]")):
+        url = urlsplit(sub_request.get("relative_url", ""))
+        status_code, body = inject_fault() or resolve(
+            sub_request.get("method", "GET"), url.path, dict(parse_qsl(url.query)), None
+        )
+        results.append({"code": status_code, "headers": [], "body": json.dumps(body)})
+    return results
+
+def usage_headers(throttled: bool) -> Dict[str, str]:
+    percent = 100 if throttled else settings["usage_percent"]
+    return {"x-app-usage": json.dumps({"call_count": percent, "total_cputime": percent // 2, "total_time": percent // 2})}
+
+@app.get("/fake/stats")
+async def get_fake_stats():
+    """Get request and injected fault counts"""
+    return {**fake_stats, "settings": settings}
+
+@app.api_route("/{version}/{path:path}", methods=["GET", "POST"])
+async def graph_api(version: str, path: str, request: Request):
+    """Serve any Graph call after a sampled latency"""
+    fake_stats["requests"] += 1
+    await asyncio.sleep(random.lognormvariate(0, settings["latency_sigma"]) * settings["latency_ms"] / 1000)
+    
+    params = dict(request.query_params)
+    body: Any = None
+    if request.method == "POST":
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = await request.json()
+        else:
+            # Batch calls and form-encoded posts; parsed here to avoid needing python-multipart
+            form = dict(parse_qsl((await request.body()).decode()))
+            if not path.strip("/"):
+                return JSONResponse(run_batch(form), headers=usage_headers(False))
+            params.update(form)
+    
+    fault = inject_fault()
+    status_code, response_body = fault or resolve(request.method, path, params, body)
+    throttled = fault is not None and fault[0] == 400
+    return JSONResponse(response_body, status_code=status_code, headers=usage_headers(throttled))
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Facebook Graph API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--seed", type=int, help="Seed latency and fault sampling for reproducible runs")
+    for name, default in settings.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    for name in settings:
+        settings[name] = getattr(args, name)
+    if args.seed is not None:
+        random.seed(args.seed)
+    
+    print(f"Fake Graph API at http://{args.host}:{args.port}/v18.0")
+    print(f"Point the CRM at it with FACEBOOK_GRAPH_URL=http://{args.host}:{args.port}/v18.0")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
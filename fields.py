@@ -0,0 +1,60 @@
+from fastapi import HTTPException
+from typing import Dict, List, Any, Optional, Tuple
+
+from config import GRAPH_MAX_PAGE_SIZE
+
+# Graph fields callers may select with fields=; ids are always requested
+CONVERSATION_FIELD_CHOICES = ("participants", "updated_time", "message_count", "unread_count")
+MESSAGE_FIELD_CHOICES = ("created_time", "from", "to", "message")
+LEAD_FIELD_CHOICES = (
+    "created_time",
+    "field_data",
+    "ad_id",
+    "ad_name",
+    "adset_id",
+    "adset_name",
+    "campaign_id",
+    "campaign_name",
+    "is_organic",
+    "platform",
+)
+
+def select_fields(requested: Optional[str], choices: Tuple[str, ...], required: Tuple[str, ...] = ()) -> Optional[List[str]]:
+    """Parse a comma-separated fields parameter against choices
+    
+    Returns None when no fields were requested, meaning the defaults.
+    Fields in required are always included; "id" may be named but is
+    implied. Unknown fields are rejected with a 400.
+    """
+    if requested is None:
+        return None
+    
+    selected = list(required)
+    for field in requested.split(","):
+        field = field.strip()
+        if not field or field == "id" or field in selected:
+            continue
+        if field not in choices:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown field '{field}'; choose from {', '.join(choices)}"
+            )
+        selected.append(field)
+    return selected
+
+def graph_fields(selected: Optional[List[str]], default: str) -> str:
+    """Build the Graph fields= value for a selection"""
+    if selected is None:
+        return default
+    return ",".join(["id", *selected])
+
+def check_page_size(name: str, value: int) -> int:
+    """Reject a Graph page size outside 1..GRAPH_MAX_PAGE_SIZE with a 400"""
+    if not 1 <= value <= GRAPH_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"{name} must be between 1 and {GRAPH_MAX_PAGE_SIZE}")
+    return value
+
+def project(record: Dict[str, Any], selected: Optional[List[str]], choices: Tuple[str, ...]) -> Dict[str, Any]:
+    """Drop the keys of a record that are selectable but were not selected"""
+    if selected is None:
+        return record
+    return {key: value for key, value in record.items() if key not in choices or key in selected}
@@ -0,0 +1,387 @@
+import asyncio
+import json
+import random
+import re
+import time
+import httpx
+from typing import Dict, List, Any, AsyncIterator, Optional, Tuple
+from urllib.parse import urlencode
+
+from config import (
+    FACEBOOK_GRAPH_URL,
+    GRAPH_HTTP2,
+    GRAPH_MAX_CONNECTIONS,
+    GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+    GRAPH_KEEPALIVE_EXPIRY,
+    GRAPH_FANOUT_CONCURRENCY,
+    GRAPH_BATCH_SIZE,
+    GRAPH_CACHE_DEFAULT_TTL,
+    GRAPH_CACHE_TTLS,
+    GRAPH_CONNECT_TIMEOUT,
+    GRAPH_DEFAULT_TIMEOUT,
+    GRAPH_TIMEOUTS,
+    GRAPH_HEDGE_DELAY,
+)
+from cache import graph_cache
+from breaker import graph_breaker
+from deadline import remaining_time
+from singleflight import singleflight
+from usage import record_usage, throttle
+from metrics import Counter, Histogram
+
+# Graph error codes that mean "slow down" rather than "this call is invalid"
+THROTTLING_ERROR_CODES = {4, 17, 32, 613}
+# Graph error codes for temporary server-side failures
+TRANSIENT_ERROR_CODES = {1, 2}
+
+class GraphError(Exception):
+    """A Graph API request that did not return 200"""
+    
+    def __init__(self, status_code: Optional[int], details: Any):
+        super().__init__(f"Graph API error {status_code}: {details}")
+        self.status_code = status_code
+        self.details = details
+
+class GraphUnavailable(httpx.TransportError):
+    """A Graph call refused without being sent, because the circuit is open"""
+
+class GraphDeadlineExceeded(httpx.TimeoutException):
+    """A Graph call not sent or not finished before the current request's deadline"""
+
+graph_requests = Counter(
+    "graph_requests_total", "Graph API calls, by endpoint template and status", ("method", "endpoint", "status")
+)
+graph_errors = Counter(
+    "graph_request_errors_total", "Graph API calls that failed or returned non-200", ("method", "endpoint")
+)
+graph_latency = Histogram(
+    "graph_request_duration_seconds", "Graph API call latency, by endpoint template", ("method", "endpoint")
+)
+graph_hedges = Counter(
+    "graph_hedged_requests_total", "Slow Graph GETs sent a second time, by which copy answered first", ("endpoint", "winner")
+)
+
+# Shared Graph API client, opened and closed by the app lifespan in main.py
+_client: Optional[httpx.AsyncClient] = None
+
+# Fan-out caps shared by every request made with the same access token
+_token_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def _http2_available() -> bool:
+    """Check whether the optional h2 package is installed"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _create_client() -> httpx.AsyncClient:
+    """Create a pooled keep-alive client for graph.facebook.com"""
+    return httpx.AsyncClient(
+        base_url=FACEBOOK_GRAPH_URL,
+        http2=GRAPH_HTTP2 and _http2_available(),
+        limits=httpx.Limits(
+            max_connections=GRAPH_MAX_CONNECTIONS,
+            max_keepalive_connections=GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GRAPH_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(GRAPH_DEFAULT_TIMEOUT, connect=GRAPH_CONNECT_TIMEOUT),
+    )
+
+async def start_graph_client() -> httpx.AsyncClient:
+    """Open the shared Graph API client"""
+    return get_graph_client()
+
+async def close_graph_client():
+    """Close the shared Graph API client and its pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_graph_client() -> httpx.AsyncClient:
+    """Get the shared Graph API client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = _create_client()
+    return _client
+
+def get_token_semaphore(access_token: str) -> asyncio.Semaphore:
+    """Get the semaphore capping concurrent fan-out calls for an access token"""
+    semaphore = _token_semaphores.get(access_token)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(GRAPH_FANOUT_CONCURRENCY)
+        _token_semaphores[access_token] = semaphore
+    return semaphore
+
+def endpoint_template(path: str) -> str:
+    """Replace the object ids in a Graph path with {id}, e.g. /{id}/messages
+
+    Graph object ids always contain digits while edge names never do.
+    """
+    segments = path.strip("/").split("/")
+    return "/" + "/".join("{id}" if re.search(r"\d", segment) else segment for segment in segments)
+
+async def _request(method: str, path: str, endpoint: str, **kwargs) -> httpx.Response:
+    """Make one HTTP call, sending a slow GET a second time after GRAPH_HEDGE_DELAY
+
+    The hedged copy races the original and whichever succeeds first is
+    used; GETs to Graph are idempotent, so the loser is simply cancelled.
+    """
+    client = get_graph_client()
+    if method != "GET" or GRAPH_HEDGE_DELAY is None:
+        return await client.request(method, path, **kwargs)
+    
+    original = asyncio.ensure_future(client.request(method, path, **kwargs))
+    tasks = {original}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=GRAPH_HEDGE_DELAY)
+        if done:
+            return original.result()
+        
+        tasks.add(asyncio.ensure_future(client.request(method, path, **kwargs)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    graph_hedges.inc(endpoint, "original" if task is original else "hedge")
+                    return task.result()
+        return original.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def has_graph_error(response: httpx.Response) -> bool:
+    """Check whether a response carries a Graph error object, i.e. Graph itself answered"""
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return isinstance(body, dict) and isinstance(body.get("error"), dict)
+
+async def _send(method: str, path: str, owner_id: Optional[str] = None, **kwargs) -> httpx.Response:
+    """Send one request to the Graph API, recording usage headers and metrics
+
+    Calls fail fast with GraphUnavailable while the circuit breaker is
+    open, and with GraphDeadlineExceeded once the current deadline has
+    passed. Each call gets its endpoint's read timeout from GRAPH_TIMEOUTS.
+    Only transport errors and 5xx responses without a Graph error body
+    count against the circuit; Graph reports per-object failures as 500s
+    with an error body, and those say nothing about Graph being down.
+    """
+    endpoint = endpoint_template(path)
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        graph_requests.inc(method, endpoint, "deadline")
+        raise GraphDeadlineExceeded(f"Deadline passed before {method} {endpoint}")
+    if not graph_breaker.allow():
+        graph_requests.inc(method, endpoint, "circuit_open")
+        raise GraphUnavailable(f"Graph circuit open; retry in {graph_breaker.retry_after():.0f}s")
+    
+    timeout = httpx.Timeout(GRAPH_TIMEOUTS.get(endpoint, GRAPH_DEFAULT_TIMEOUT), connect=GRAPH_CONNECT_TIMEOUT)
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(_request(method, path, endpoint, timeout=timeout, **kwargs), remaining)
+    except asyncio.TimeoutError:
+        # Our own deadline, not a sign of Graph being unhealthy
+        graph_breaker.record_abandoned()
+        graph_latency.observe(time.perf_counter() - started, method, endpoint)
+        graph_requests.inc(method, endpoint, "deadline")
+        graph_errors.inc(method, endpoint)
+        raise GraphDeadlineExceeded(f"Deadline passed during {method} {endpoint}")
+    except httpx.HTTPError:
+        graph_breaker.record_failure()
+        graph_latency.observe(time.perf_counter() - started, method, endpoint)
+        graph_requests.inc(method, endpoint, "error")
+        graph_errors.inc(method, endpoint)
+        raise
+    except asyncio.CancelledError:
+        graph_breaker.record_abandoned()
+        raise
+    
+    if response.status_code >= 500 and not has_graph_error(response):
+        graph_breaker.record_failure()
+    else:
+        graph_breaker.record_success()
+    graph_latency.observe(time.perf_counter() - started, method, endpoint)
+    graph_requests.inc(method, endpoint, response.status_code)
+    if response.status_code != 200:
+        graph_errors.inc(method, endpoint)
+    record_usage(response.headers, owner_id)
+    return response
+
+async def graph_get(
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    owner_id: Optional[str] = None,
+    cache: bool = False
+) -> httpx.Response:
+    """Send a GET request to the Graph API
+
+    owner_id is the page or ad account the call is made for; its usage
+    headers are recorded against it. Concurrent identical requests (same
+    path and params, token included) share one upstream call. With cache
+    set, successful responses are kept in the shared response cache for
+    the endpoint's TTL, tagged with owner_id so webhook events for that
+    page can invalidate them.
+    """
+    key = (path, tuple(sorted((name, str(value)) for name, value in (params or {}).items())))
+    
+    if cache:
+        response = graph_cache.get(key)
+        if response is not None:
+            return response
+    
+    response = await singleflight(("GET",) + key, lambda: _send("GET", path, owner_id, params=params))
+    if cache and response.status_code == 200:
+        ttl = GRAPH_CACHE_TTLS.get(endpoint_template(path), GRAPH_CACHE_DEFAULT_TTL)
+        graph_cache.set(key, response, ttl, len(response.content), owner_id)
+    return response
+
+async def graph_post(
+    path: str,
+    json: Any = None,
+    params: Optional[Dict[str, Any]] = None,
+    data: Optional[Dict[str, Any]] = None,
+    owner_id: Optional[str] = None
+) -> httpx.Response:
+    """Send a POST request to the Graph API"""
+    return await _send("POST", path, owner_id, json=json, params=params, data=data)
+
+def is_retryable(status_code: Optional[int], body: Any) -> bool:
+    """Check whether a failed Graph call is worth retrying
+
+    Network errors (no status code), 429s, 5xx responses, throttling and
+    transient Graph error codes are retried; other errors are final.
+    """
+    if status_code is None or status_code == 429 or status_code >= 500:
+        return True
+    error = body.get("error", {}) if isinstance(body, dict) else {}
+    return (
+        error.get("code") in THROTTLING_ERROR_CODES
+        or error.get("code") in TRANSIENT_ERROR_CODES
+        or bool(error.get("is_transient"))
+    )
+
+# Failures raised before the request reached Graph, so a retry cannot repeat it
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, GraphUnavailable)
+
+def is_send_retryable(error: Optional[httpx.HTTPError], status_code: Optional[int], body: Any) -> bool:
+    """Check whether a failed non-idempotent call, such as a message send, is safe to retry
+
+    Unlike is_retryable, read timeouts, dropped connections and 5xx
+    responses are final: Graph, or a gateway in front of it, may already
+    have acted on the request. Connection failures, an open circuit and
+    5xx Graph errors marked transient or throttled are retried, like other
+    responses Graph marks as retryable.
+    """
+    if error is not None:
+        return isinstance(error, UNSENT_ERRORS)
+    if status_code is not None and status_code >= 500:
+        graph_error = body.get("error", {}) if isinstance(body, dict) else {}
+        return bool(graph_error.get("is_transient")) or graph_error.get("code") in THROTTLING_ERROR_CODES
+    return is_retryable(status_code, body)
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Exponential backoff with jitter for the given attempt number"""
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def batch_url(path: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Build a relative_url for a Graph batch sub-request"""
+    relative_url = path.lstrip("/")
+    if params:
+        relative_url += "?" + urlencode(params)
+    return relative_url
+
+async def graph_batch(
+    relative_urls: List[str],
+    access_token: str,
+    owner_id: Optional[str] = None
+) -> List[Tuple[Optional[int], Any]]:
+    """Run GET sub-requests through the Graph Batch API
+
+    Sub-requests are packed GRAPH_BATCH_SIZE per call and the calls run
+    concurrently under the token's fan-out cap. Returns one
+    (status_code, body) pair per relative URL, in order. The body is the
+    parsed JSON of the sub-response, or an error description when the
+    sub-request or its whole batch call failed; status_code is None when
+    no status is available.
+    """
+    semaphore = get_token_semaphore(access_token)
+    chunks = [
+        relative_urls[i:i + GRAPH_BATCH_SIZE]
+        for i in range(0, len(relative_urls), GRAPH_BATCH_SIZE)
+    ]
+    
+    async def run_chunk(chunk: List[str]) -> List[Tuple[Optional[int], Any]]:
+        batch = [{"method": "GET", "relative_url": url} for url in chunk]
+        try:
+            async with semaphore:
+                response = await graph_post(
+                    "/",
+                    data={
+                        "batch": json.dumps(batch),
+                        "include_headers": "false",
+                        "access_token": access_token
+                    },
+                    owner_id=owner_id
+                )
+        except httpx.HTTPError as e:
+            return [(None, str(e))] * len(chunk)
+        
+        if response.status_code != 200:
+            return [(response.status_code, response.text)] * len(chunk)
+        
+        results = []
+        for item in response.json():
+            # Graph returns null for sub-requests that did not complete
+            if item is None:
+                results.append((None, "Batch sub-request did not complete"))
+                continue
+            try:
+                body = json.loads(item.get("body") or "null")
+            except ValueError:
+                body = item.get("body")
+            results.append((item.get("code"), body))
+        return results
+    
+    chunk_results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+    return [result for chunk_result in chunk_results for result in chunk_result]
+
+async def graph_paginate(
+    path: str,
+    params: Optional[Dict[str, Any]] = None,
+    after: Optional[str] = None,
+    owner_id: Optional[str] = None
+) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """Follow a Graph edge's cursor pagination
+
+    Yields each page's data with the after cursor of the next page, which
+    is None on the last page. Pass after to resume from a cursor. Each
+    page fetch waits out the usage throttle of owner_id first. Raises
+    GraphError when a page cannot be fetched.
+    """
+    params = dict(params or {})
+    if after:
+        params["after"] = after
+    
+    while True:
+        await throttle(owner_id)
+        try:
+            response = await graph_get(path, params=params, owner_id=owner_id)
+        except httpx.HTTPError as e:
+            raise GraphError(None, str(e))
+        if response.status_code != 200:
+            raise GraphError(response.status_code, response.text)
+        
+        body = response.json()
+        paging = body.get("paging", {})
+        next_after = paging.get("cursors", {}).get("after") if paging.get("next") else None
+        
+        yield body.get("data", []), next_after
+        
+        if not next_after:
+            break
+        params["after"] = next_after
@@ -0,0 +1,31 @@
+from typing import Dict, Any
+
+from breaker import graph_breaker
+
+# Whether this worker has finished starting up and is not shutting down
+_state: Dict[str, Any] = {"ready": False, "draining": False}
+
+def mark_ready():
+    """Mark this worker as ready to serve traffic"""
+    _state["ready"] = True
+    _state["draining"] = False
+
+def mark_draining():
+    """Mark this worker as shutting down, so load balancers stop routing to it"""
+    _state["ready"] = False
+    _state["draining"] = True
+
+def is_draining() -> bool:
+    """Check whether this worker has started shutting down"""
+    return _state["draining"]
+
+def is_ready() -> bool:
+    """Check whether this worker is ready to serve traffic"""
+    return _state["ready"]
+
+def get_health() -> Dict[str, Any]:
+    """Get this worker's readiness state and the Graph circuit breaker's"""
+    return {
+        "status": "ready" if _state["ready"] else ("draining" if _state["draining"] else "starting"),
+        "graph_circuit": graph_breaker.state
+    }
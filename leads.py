@@ -1,60 +1,432 @@
-import requests
+import asyncio
+import json
+import httpx
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, AsyncIterator, Optional, Tuple
 
-from config import FACEBOOK_GRAPH_URL
-from models import get_client_token, client_exists
+from config import LEADGEN_MAX_ATTEMPTS, LEADGEN_RETRY_BASE_DELAY, LEADGEN_RETRY_MAX_DELAY, GRAPH_REQUEST_DEADLINE
+from graph import (
+    graph_get,
+    graph_batch,
+    graph_paginate,
+    batch_url,
+    get_token_semaphore,
+    is_retryable,
+    backoff_delay,
+    GraphError,
+)
+from deadline import graph_deadline
+from models import get_client_token, client_exists, get_page_token
+from store import save_leads, get_lead_watermark, set_lead_watermark
+from usage import throttle
+from metrics import Counter
+from fields import LEAD_FIELD_CHOICES, select_fields, graph_fields, check_page_size
+from live import publish_page_event
+from log import get_logger
 
-async def get_facebook_leads(client_id: str, limit: int = 25) -> Dict[str, Any]:
-    """Retrieve Facebook leads for a client"""
+logger = get_logger("leads")
+
+leadgen_results = Counter("leadgen_leads_total", "Leads from leadgen webhooks, by outcome", ("outcome",))
+
+# Graph fields requested for each lead
+LEAD_FIELDS = "id,created_time,field_data"
+
+async def get_facebook_leads(
+    client_id: str,
+    limit: int = 25,
+    batch: bool = False,
+    fields: Optional[str] = None
+) -> Dict[str, Any]:
+    """Retrieve Facebook leads for a client
+
+    fields, a comma-separated subset of LEAD_FIELD_CHOICES, is requested
+    from Graph as is; by default leads carry created_time and field_data.
+    The walk gets GRAPH_REQUEST_DEADLINE in total. Forms whose leads could
+    not be fetched, in time or at all, and ad accounts whose forms could
+    not be listed are returned in failed_forms, and partial is set.
+    """
+    selected = select_fields(fields, LEAD_FIELD_CHOICES)
+    check_page_size("limit", limit)
     if not client_exists(client_id):
         return {"error": "Client not connected"}
     
     client_token = get_client_token(client_id)
     access_token = client_token["access_token"]
     
-    # Get ad accounts
-    accounts_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/me/adaccounts?access_token={access_token}"
-    )
+    with graph_deadline(GRAPH_REQUEST_DEADLINE):
+        # Get ad accounts
+        accounts_response = await graph_get(
+            "/me/adaccounts", params={"access_token": access_token}
+        )
+        
+        if accounts_response.status_code != 200:
+            return {"error": "Failed to fetch ad accounts", "details": accounts_response.text}
+        
+        accounts_data = accounts_response.json()
+        
+        if batch:
+            leads_data, failed_forms = await collect_leads_batched(
+                accounts_data.get("data", []), access_token, limit, selected
+            )
+        else:
+            leads_data, failed_forms = await collect_leads(accounts_data.get("data", []), access_token, limit, selected)
     
-    if accounts_response.status_code != 200:
-        return {"error": "Failed to fetch ad accounts", "details": accounts_response.text}
+    return {
+        "client_id": client_id,
+        "total_leads": len(leads_data),
+        "leads": leads_data,
+        "failed_forms": failed_forms,
+        "partial": bool(failed_forms),
+        "retrieved_at": datetime.now().isoformat()
+    }
+
+def format_lead(
+    lead: Dict[str, Any],
+    form_id: str,
+    form_name: Optional[str],
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Format a Graph lead for the API response, with only fields when given"""
+    formatted = {"lead_id": lead.get("id"), "form_id": form_id, "form_name": form_name}
+    if fields is None:
+        formatted["created_time"] = lead.get("created_time")
+        formatted["field_data"] = lead.get("field_data", [])
+        return formatted
     
-    accounts_data = accounts_response.json()
+    for field in fields:
+        formatted[field] = lead.get(field, [] if field == "field_data" else None)
+    return formatted
+
+def lead_params(limit: int, fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Graph parameters for one page of a form's leads"""
+    return {"fields": graph_fields(fields, LEAD_FIELDS), "limit": limit}
+
+async def collect_leads(
+    accounts: List[Dict[str, Any]],
+    access_token: str,
+    limit: int,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Walk accounts → forms → leads one request at a time
+
+    Returns the leads and the accounts and forms that failed, each failure
+    with its status code (None for network errors and missed deadlines)
+    and details.
+    """
     leads_data = []
+    failed = []
     
-    # Loop through accounts → forms → leads
-    for account in accounts_data.get("data", []):
+    for account in accounts:
         account_id = account["id"]
-        forms_response = requests.get(
-            f"{FACEBOOK_GRAPH_URL}/{account_id}/leadgen_forms?access_token={access_token}"
-        )
+        await throttle(account_id)
+        try:
+            forms_response = await graph_get(
+                f"/{account_id}/leadgen_forms", params={"access_token": access_token}, owner_id=account_id
+            )
+        except httpx.HTTPError as e:
+            failed.append({"account_id": account_id, "status_code": None, "details": str(e)})
+            continue
         
         if forms_response.status_code != 200:
+            failed.append({
+                "account_id": account_id, "status_code": forms_response.status_code, "details": forms_response.text
+            })
             continue
         
         for form in forms_response.json().get("data", []):
             form_id = form["id"]
             form_name = form.get("name", "Unnamed Form")
             
-            leads_response = requests.get(
-                f"{FACEBOOK_GRAPH_URL}/{form_id}/leads?access_token={access_token}&limit={limit}"
-            )
+            await throttle(account_id)
+            try:
+                leads_response = await graph_get(
+                    f"/{form_id}/leads",
+                    params={**lead_params(limit, fields), "access_token": access_token},
+                    owner_id=account_id
+                )
+            except httpx.HTTPError as e:
+                failed.append({"form_id": form_id, "status_code": None, "details": str(e)})
+                continue
             
-            if leads_response.status_code == 200:
-                for lead in leads_response.json().get("data", []):
-                    leads_data.append({
-                        "lead_id": lead.get("id"),
-                        "form_id": form_id,
-                        "form_name": form_name,
-                        "created_time": lead.get("created_time"),
-                        "field_data": lead.get("field_data", [])
-                    })
+            if leads_response.status_code != 200:
+                failed.append({
+                    "form_id": form_id, "status_code": leads_response.status_code, "details": leads_response.text
+                })
+                continue
+            
+            for lead in leads_response.json().get("data", []):
+                leads_data.append(format_lead(lead, form_id, form_name, fields))
+    
+    return leads_data, failed
+
+async def collect_leads_batched(
+    accounts: List[Dict[str, Any]],
+    access_token: str,
+    limit: int,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Walk accounts → forms → leads with one Graph batch per level
+
+    Returns the leads and the failed accounts and forms, as collect_leads.
+    """
+    leads_data = []
+    failed = []
+    
+    await throttle()
+    forms_results = await graph_batch(
+        [batch_url(f"/{account['id']}/leadgen_forms") for account in accounts],
+        access_token
+    )
+    
+    forms = []
+    for account, (status_code, body) in zip(accounts, forms_results):
+        if status_code == 200:
+            forms.extend(body.get("data", []))
+        else:
+            failed.append({"account_id": account["id"], "status_code": status_code, "details": body})
+    
+    await throttle()
+    leads_results = await graph_batch(
+        [batch_url(f"/{form['id']}/leads", lead_params(limit, fields)) for form in forms],
+        access_token
+    )
+    
+    for form, (status_code, body) in zip(forms, leads_results):
+        if status_code != 200:
+            failed.append({"form_id": form["id"], "status_code": status_code, "details": body})
+            continue
+        for lead in body.get("data", []):
+            leads_data.append(format_lead(lead, form["id"], form.get("name", "Unnamed Form"), fields))
+    
+    return leads_data, failed
+
+def stream_facebook_leads(
+    client_id: str,
+    after: Optional[str] = None,
+    limit: int = 100,
+    fields: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every lead of a client, following Graph pagination
+
+    Ad accounts, their leadgen forms and each form's leads are fully
+    paginated and yielded as Graph pages arrive. A {"next_cursor": ...}
+    record follows each completed page of ad accounts; pass that cursor
+    as after to resume. fields is requested from Graph as in
+    get_facebook_leads.
+    """
+    selected = select_fields(fields, LEAD_FIELD_CHOICES)
+    check_page_size("limit", limit)
+    
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        if not client_exists(client_id):
+            yield {"error": "Client not connected"}
+            return
+        
+        access_token = get_client_token(client_id)["access_token"]
+        account_pages = graph_paginate(
+            "/me/adaccounts", params={"access_token": access_token}, after=after
+        )
+        try:
+            async for accounts, next_after in account_pages:
+                for account in accounts:
+                    async for record in stream_account_leads(account["id"], access_token, limit, selected):
+                        yield record
+                if next_after:
+                    yield {"next_cursor": next_after}
+        except GraphError as e:
+            yield {"error": "Failed to fetch ad accounts", "details": e.details}
+    
+    return records()
+
+async def stream_account_leads(
+    account_id: str,
+    access_token: str,
+    limit: int,
+    fields: Optional[List[str]] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream the leads of every leadgen form of an ad account"""
+    form_pages = graph_paginate(
+        f"/{account_id}/leadgen_forms", params={"access_token": access_token}, owner_id=account_id
+    )
+    try:
+        async for forms, _ in form_pages:
+            for form in forms:
+                form_id = form["id"]
+                form_name = form.get("name", "Unnamed Form")
+                lead_pages = graph_paginate(
+                    f"/{form_id}/leads",
+                    params={**lead_params(limit, fields), "access_token": access_token},
+                    owner_id=account_id
+                )
+                try:
+                    async for leads, _ in lead_pages:
+                        for lead in leads:
+                            yield format_lead(lead, form_id, form_name, fields)
+                except GraphError as e:
+                    yield {"form_id": form_id, "error": "Failed to fetch leads", "details": e.details}
+    except GraphError as e:
+        yield {"account_id": account_id, "error": "Failed to fetch leadgen forms", "details": e.details}
+
+async def sync_leads(client_id: str, limit: int = 100) -> Dict[str, Any]:
+    """Fetch only the leads created since each form's last sync into the local store
+
+    Ad accounts and their forms are walked concurrently under the token's
+    fan-out cap. Each form is asked only for leads newer than its
+    watermark (Graph filtering on time_created), and the watermark
+    advances once all of the form's pages were fetched. Leads already
+    stored are skipped, so only new ones are returned.
+    """
+    if not client_exists(client_id):
+        return {"error": "Client not connected"}
+    
+    access_token = get_client_token(client_id)["access_token"]
+    semaphore = get_token_semaphore(access_token)
+    
+    try:
+        accounts = await fetch_all("/me/adaccounts", {"access_token": access_token}, semaphore)
+    except GraphError as e:
+        return {"error": "Failed to fetch ad accounts", "details": e.details}
+    
+    async def sync_account(account_id: str) -> List[Dict[str, Any]]:
+        try:
+            forms = await fetch_all(
+                f"/{account_id}/leadgen_forms", {"access_token": access_token}, semaphore, account_id
+            )
+        except GraphError as e:
+            return [{"account_id": account_id, "error": "Failed to fetch leadgen forms", "details": e.details}]
+        return await asyncio.gather(*(
+            sync_form(client_id, account_id, form, access_token, semaphore, limit) for form in forms
+        ))
+    
+    account_results = await asyncio.gather(*(sync_account(account["id"]) for account in accounts))
+    form_results = [result for results in account_results for result in results]
+    
+    new_leads = [lead for result in form_results for lead in result.pop("leads", [])]
+    failed = [result for result in form_results if "error" in result]
+    logger.info(
+        "Lead sync finished",
+        extra={
+            "client_id": client_id,
+            "accounts": len(accounts),
+            "forms": len(form_results),
+            "new_leads": len(new_leads),
+            "failed": len(failed)
+        }
+    )
     
     return {
         "client_id": client_id,
-        "total_leads": len(leads_data),
-        "leads": leads_data,
-        "retrieved_at": datetime.now().isoformat()
+        "accounts": len(accounts),
+        "forms": sum(1 for result in form_results if "form_id" in result),
+        "fetched_leads": sum(result.get("fetched", 0) for result in form_results),
+        "new_leads": len(new_leads),
+        "leads": sorted(new_leads, key=lambda lead: lead["created_time"] or "", reverse=True),
+        "failed": failed,
+        "synced_at": datetime.now().isoformat()
     }
+
+async def sync_form(
+    client_id: str,
+    account_id: str,
+    form: Dict[str, Any],
+    access_token: str,
+    semaphore: asyncio.Semaphore,
+    limit: int
+) -> Dict[str, Any]:
+    """Fetch and store a form's leads newer than its watermark"""
+    form_id = form["id"]
+    form_name = form.get("name", "Unnamed Form")
+    params: Dict[str, Any] = {"access_token": access_token, "fields": LEAD_FIELDS, "limit": limit}
+    
+    watermark = get_lead_watermark(form_id)
+    if watermark:
+        # One second of overlap so leads sharing the watermark's second are not missed
+        since = int(datetime.strptime(watermark, "%Y-%m-%dT%H:%M:%S%z").timestamp()) - 1
+        params["filtering"] = json.dumps([{"field": "time_created", "operator": "GREATER_THAN", "value": since}])
+    
+    try:
+        leads = await fetch_all(f"/{form_id}/leads", params, semaphore, account_id)
+    except GraphError as e:
+        return {"form_id": form_id, "error": "Failed to fetch leads", "details": e.details}
+    
+    formatted = [format_lead(lead, form_id, form_name) for lead in leads]
+    new_leads = save_leads(client_id, account_id, formatted)
+    newest = max((lead["created_time"] for lead in formatted if lead["created_time"]), default=None)
+    if newest:
+        set_lead_watermark(form_id, newest)
+    
+    return {"form_id": form_id, "fetched": len(formatted), "leads": new_leads}
+
+async def fetch_all(
+    path: str,
+    params: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    owner_id: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Fetch every page of a Graph edge while holding a fan-out slot"""
+    items = []
+    async with semaphore:
+        async for data, _ in graph_paginate(path, params=params, owner_id=owner_id):
+            items.extend(data)
+    return items
+
+async def deliver_lead(page_id: str, leadgen_id: str, form_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Fetch a lead announced by a leadgen webhook and store it
+
+    The lead is read with the owning page's token, retrying throttling,
+    transient and network errors with backoff. Returns the stored lead,
+    or None when it was already stored or could not be fetched.
+    """
+    page_token = get_page_token(page_id)
+    if not page_token:
+        logger.warning("Leadgen event for unknown page", extra={"page_id": page_id, "leadgen_id": leadgen_id})
+        leadgen_results.inc("unknown_page")
+        return None
+    
+    attempts = 0
+    while True:
+        attempts += 1
+        await throttle(page_id)
+        try:
+            response = await graph_get(
+                f"/{leadgen_id}",
+                params={"fields": f"{LEAD_FIELDS},form_id", "access_token": page_token["access_token"]},
+                owner_id=page_id
+            )
+        except httpx.HTTPError as e:
+            status_code, body = None, str(e)
+        else:
+            if response.status_code == 200:
+                break
+            status_code = response.status_code
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+        
+        if attempts >= LEADGEN_MAX_ATTEMPTS or not is_retryable(status_code, body):
+            logger.warning(
+                "Lead fetch failed",
+                extra={
+                    "page_id": page_id,
+                    "leadgen_id": leadgen_id,
+                    "attempts": attempts,
+                    "status_code": status_code,
+                    "details": body
+                }
+            )
+            leadgen_results.inc("failed")
+            return None
+        await asyncio.sleep(backoff_delay(attempts, LEADGEN_RETRY_BASE_DELAY, LEADGEN_RETRY_MAX_DELAY))
+    
+    lead = response.json()
+    formatted = format_lead(lead, lead.get("form_id") or form_id, None)
+    new_leads = save_leads(page_token.get("client_id"), None, [formatted])
+    leadgen_results.inc("stored" if new_leads else "duplicate")
+    if new_leads:
+        publish_page_event(page_id, "lead", new_leads[0])
+    logger.info(
+        "Lead received",
+        extra={"page_id": page_id, "leadgen_id": leadgen_id, "form_id": formatted["form_id"], "new": bool(new_leads)}
+    )
+    return new_leads[0] if new_leads else None
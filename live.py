@@ -0,0 +1,207 @@
+import asyncio
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+from typing import Dict, List, Any, AsyncIterator, Optional, Set
+
+from config import LIVE_QUEUE_SIZE, LIVE_MAX_SUBSCRIBERS, LIVE_HEARTBEAT_INTERVAL
+from models import get_page_token
+from metrics import Callback
+from health import is_draining
+from responses import dumps
+from log import get_logger
+
+logger = get_logger("live")
+
+class Subscription:
+    """A subscriber's bounded buffer of live events
+    
+    When the buffer is full the subscriber is too slow to keep up: its
+    buffer is dropped and it receives None, ending its stream.
+    """
+
+    def __init__(self, topics: List[str], size: int):
+        self.topics = topics
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=size)
+        self.dropped = False
+        self.closed = False
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Buffer an event without waiting; returns False once the subscriber is dropped"""
+        if self.dropped or self.closed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return False
+
+    def close(self):
+        """End the subscriber's stream: it receives None next, with closed set"""
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to timeout for the next event; raises asyncio.TimeoutError when idle"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+# Subscriptions by topic ("page:{page_id}" or "client:{client_id}"), in this process only
+_subscriptions: Dict[str, Set[Subscription]] = {}
+
+# Final event of a stream: why it ended
+DROPPED_EVENT = {"type": "dropped", "data": {"reason": "Subscriber fell behind; reconnect and reload"}}
+SHUTDOWN_EVENT = {"type": "shutdown", "data": {"reason": "Server is shutting down; reconnect"}}
+
+live_stats = {"published": 0, "delivered": 0, "dropped_subscribers": 0}
+
+Callback("live_subscribers", "Connected live event subscribers", lambda: len(_all_subscriptions()))
+Callback(
+    "live_events_total",
+    "Live events published, delivered to subscribers, and subscribers dropped as too slow",
+    lambda: {(name,): live_stats[name] for name in live_stats},
+    labelnames=("outcome",),
+    kind="counter"
+)
+
+def page_topic(page_id: str) -> str:
+    return f"page:{page_id}"
+
+def client_topic(client_id: str) -> str:
+    return f"client:{client_id}"
+
+def _all_subscriptions() -> Set[Subscription]:
+    return set().union(*_subscriptions.values()) if _subscriptions else set()
+
+def subscribe(topics: List[str]) -> Subscription:
+    """Register a subscriber for events on any of topics"""
+    if is_draining():
+        raise HTTPException(status_code=503, detail="Server is shutting down")
+    if len(_all_subscriptions()) >= LIVE_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+    subscription = Subscription(topics, LIVE_QUEUE_SIZE)
+    for topic in topics:
+        _subscriptions.setdefault(topic, set()).add(subscription)
+    return subscription
+
+def unsubscribe(subscription: Subscription):
+    """Remove a subscriber from all its topics"""
+    for topic in subscription.topics:
+        subscribers = _subscriptions.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscriptions[topic]
+
+def close_subscriptions():
+    """End every live stream with a shutdown event, as the worker drains"""
+    for subscription in _all_subscriptions():
+        subscription.close()
+        unsubscribe(subscription)
+
+def publish(topics: List[str], event: Dict[str, Any]):
+    """Hand an event to every subscriber of any of topics, dropping those that are full"""
+    live_stats["published"] += 1
+    subscribers = set()
+    for topic in topics:
+        subscribers |= _subscriptions.get(topic, set())
+    
+    for subscription in subscribers:
+        if subscription.offer(event):
+            live_stats["delivered"] += 1
+        elif subscription.dropped:
+            live_stats["dropped_subscribers"] += 1
+            logger.warning("Dropped slow live subscriber", extra={"topics": subscription.topics})
+            unsubscribe(subscription)
+
+def publish_page_event(page_id: str, event_type: str, data: Dict[str, Any]):
+    """Publish an event to subscribers of a page and of the client owning it"""
+    topics = [page_topic(page_id)]
+    page_token = get_page_token(page_id)
+    if page_token and page_token.get("client_id"):
+        topics.append(client_topic(page_token["client_id"]))
+    if not any(topic in _subscriptions for topic in topics):
+        return
+    publish(topics, {"type": event_type, "page_id": page_id, "data": data})
+
+async def events(subscription: Subscription) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Yield a subscriber's events, or None after each idle heartbeat interval
+    
+    Ends with a final "dropped" event if the subscriber fell behind, or
+    "shutdown" if the worker is draining, and unsubscribes when the
+    consumer stops iterating.
+    """
+    try:
+        while True:
+            try:
+                event = await subscription.get(LIVE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event is None:
+                yield SHUTDOWN_EVENT if subscription.closed else DROPPED_EVENT
+                return
+            yield event
+    finally:
+        unsubscribe(subscription)
+
+async def sse_stream(subscription: Subscription) -> AsyncIterator[str]:
+    """Format a subscriber's events as Server-Sent Events, with keep-alive comments"""
+    yield ": connected\n\n"
+    async for event in events(subscription):
+        if event is None:
+            yield ": keep-alive\n\n"
+        else:
+            yield f"event: {event['type']}\ndata: {dumps(event).decode()}\n\n"
+
+async def serve_websocket(websocket: WebSocket, topics: List[str]):
+    """Push a subscriber's events over an accepted WebSocket until either side closes"""
+    subscription = subscribe(topics)
+    
+    async def wait_for_disconnect():
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+    
+    disconnected = asyncio.create_task(wait_for_disconnect())
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait(
+                [getter, disconnected], timeout=LIVE_HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter not in done:
+                getter.cancel()
+                if disconnected in done:
+                    break
+                await websocket.send_json({"type": "keep-alive"})
+                continue
+            
+            event = getter.result()
+            if event is None:
+                if subscription.closed:
+                    await websocket.send_json(SHUTDOWN_EVENT)
+                    await websocket.close(code=1001)
+                else:
+                    await websocket.send_json(DROPPED_EVENT)
+                    await websocket.close(code=1013)
+                break
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        unsubscribe(subscription)
+
+def get_live_stats() -> Dict[str, Any]:
+    """Get subscriber counts and event counters"""
+    return {
+        "subscribers": len(_all_subscriptions()),
+        "topics": {topic: len(subscribers) for topic, subscribers in _subscriptions.items()},
+        **live_stats
+    }
@@ -0,0 +1,95 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_WEBHOOK_SAMPLE_RATE
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Background thread writing queued records to stdout
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def get_logger(name: str) -> logging.Logger:
+    """Get a logger under the app's crm namespace"""
+    return logging.getLogger(f"crm.{name}")
+
+class StructuredFormatter(logging.Formatter):
+    """Format records as JSON lines, or as key=value text"""
+
+    def __init__(self, fmt: str = "json"):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            key: value for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_")
+        }
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat()
+        
+        if self.fmt == "json":
+            return json.dumps({
+                "ts": timestamp,
+                "level": record.levelname,
+                "logger": record.name,
+                "event": record.getMessage(),
+                **fields
+            }, default=str)
+        
+        pairs = " ".join(f"{key}={json.dumps(value, default=str)}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname:<7} {record.name} {record.getMessage()} {pairs}".rstrip()
+
+class SamplingFilter(logging.Filter):
+    """Let through a random share of records below WARNING"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+def setup_logging():
+    """Route crm.* logs through a queue to a background stdout writer
+    
+    Request handlers only put records on an in-memory queue, so a slow
+    stdout never blocks the event loop. Per-message webhook logs go
+    through the sampled crm.webhook.events logger.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter(LOG_FORMAT))
+    
+    root = logging.getLogger("crm")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.propagate = False
+    
+    events_logger = get_logger("webhook.events")
+    if not any(isinstance(f, SamplingFilter) for f in events_logger.filters):
+        events_logger.addFilter(SamplingFilter(LOG_WEBHOOK_SAMPLE_RATE))
+    
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the background writer"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger("crm")
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
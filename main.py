@@ -1,22 +1,123 @@
+import argparse
+import asyncio
+import importlib.util
+import signal
 import uvicorn
 import threading
-import time
 import sys
 import uuid
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from typing import Dict
 
-from config import HOST, PORT, get_oauth_url, FACEBOOK_APP_ID
+from config import HOST, PORT, SERVER_WORKERS, SERVER_GRACEFUL_TIMEOUT, SERVER_DRAIN_DELAY, LIVE_ENABLED, SEND_RATE_PER_SECOND, get_oauth_url, FACEBOOK_APP_ID
 from routes import setup_routes
+from graph import start_graph_client, close_graph_client
+from webhook import start_webhook_workers, stop_webhook_workers
+from sender import drain_sends
+from metrics import RequestMetricsMiddleware
+from responses import FastJSONResponse
+from log import setup_logging, stop_logging
+from health import mark_ready, mark_draining, is_draining
+from live import close_subscriptions
 from terminal import terminal_interface
 
-app = FastAPI()
+def drain_on_exit():
+    """Start draining as soon as SIGINT/SIGTERM arrives, before uvicorn closes its sockets
+    
+    uvicorn runs the lifespan shutdown only after closing its listening
+    sockets and waiting for open requests, too late for /health/ready to
+    report draining or for live streams to end. This wraps uvicorn's
+    signal handlers: the first signal marks the worker draining and ends
+    live streams, and reaches uvicorn SERVER_DRAIN_DELAY later, while the
+    worker still answers probes. A second signal reaches it at once.
+    Signals are only handled in the main thread, so the terminal's
+    background server is left as is.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        uvicorn_handler = signal.getsignal(sig)
+        if not callable(uvicorn_handler):
+            continue
+
+        def handle_exit(signum, frame, uvicorn_handler=uvicorn_handler):
+            if is_draining():
+                uvicorn_handler(signum, frame)
+                return
+            mark_draining()
+            loop.call_soon_threadsafe(close_subscriptions)
+            loop.call_soon_threadsafe(loop.call_later, SERVER_DRAIN_DELAY, uvicorn_handler, signum, frame)
+        
+        signal.signal(sig, handle_exit)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    setup_logging()
+    await start_graph_client()
+    start_webhook_workers()
+    mark_ready()
+    drain_on_exit()
+    yield
+    mark_draining()
+    close_subscriptions()
+    await stop_webhook_workers()
+    await drain_sends()
+    await close_graph_client()
+    stop_logging()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Setup all routes
 setup_routes(app)
 
-def start_server():
-    """Start the FastAPI server"""
-    uvicorn.run(app, host=HOST, port=PORT, reload=False)
+def server_options() -> Dict[str, str]:
+    """Pick uvloop and httptools when they are installed"""
+    return {
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11"
+    }
+
+def check_workers(workers: int):
+    """Refuse worker counts the in-process state cannot support
+    
+    The live registry, cache invalidation and send pacing are held in
+    each worker's memory. With several workers a live subscriber misses
+    events published by the others, so that needs LIVE_ENABLED off.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if workers > 1 and LIVE_ENABLED:
+        raise ValueError("Live endpoints need a single worker process; set LIVE_ENABLED = False to run several")
+
+def start_server(host: str = HOST, port: int = PORT, workers: int = SERVER_WORKERS):
+    """Run the server in the foreground with one or more worker processes
+    
+    On SIGINT/SIGTERM each worker stops taking requests, waits up to
+    SERVER_GRACEFUL_TIMEOUT for open ones and then drains its webhook
+    queue and unsent messages before exiting.
+    """
+    check_workers(workers)
+    if workers > 1:
+        print(
+            f"Warning: caches and send pacing are per worker; a page may be sent up to "
+            f"{workers * SEND_RATE_PER_SECOND:g} messages/s across {workers} workers",
+            file=sys.stderr
+        )
+    
+    uvicorn.run(
+        "main:app" if workers > 1 else app,
+        host=host,
+        port=port,
+        workers=workers,
+        reload=False,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        **server_options()
+    )
 
 def print_startup_info():
     """Print startup information"""
@@ -34,19 +135,54 @@ def print_startup_info():
     print(" • All previous endpoints still available")
     print("=" * 80)
 
-if __name__ == "__main__":
+def run_with_terminal():
+    """Run a single-process server in a background thread with the terminal in front"""
     print_startup_info()
     
-    # Start server in background thread
-    server_thread = threading.Thread(target=start_server, daemon=True)
+    server = uvicorn.Server(uvicorn.Config(
+        app, host=HOST, port=PORT, timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT, **server_options()
+    ))
+    server_thread = threading.Thread(target=server.run, daemon=True)
     server_thread.start()
     
-    # Wait for server to start
-    time.sleep(2)
-    
-    # Start terminal interface
+    # The terminal waits on /health/ready before showing its menu
     try:
         terminal_interface()
     except KeyboardInterrupt:
-        print("\n👋 Server shutting down...")
-        sys.exit(0)
+        pass
+    
+    print("\n👋 Server shutting down...")
+    server.should_exit = True
+    server_thread.join(SERVER_GRACEFUL_TIMEOUT)
+    sys.exit(0)
+
+def parse_args() -> argparse.Namespace:
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Facebook CRM Integration Server")
+    modes = parser.add_subparsers(dest="mode")
+    
+    serve = modes.add_parser("serve", help="Run the server headless, without the terminal")
+    serve.add_argument("--host", default=HOST)
+    serve.add_argument("--port", type=int, default=PORT)
+    serve.add_argument("--workers", type=int, default=SERVER_WORKERS)
+    
+    terminal = modes.add_parser("terminal", help="Run only the terminal, against a running server")
+    terminal.add_argument("--url", default=f"http://{HOST}:{PORT}")
+    
+    args = parser.parse_args()
+    if args.mode == "serve":
+        try:
+            check_workers(args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    if args.mode == "serve":
+        start_server(args.host, args.port, args.workers)
+    elif args.mode == "terminal":
+        terminal_interface(args.url)
+    else:
+        run_with_terminal()
@@ -1,43 +1,107 @@
-import requests
+import asyncio
+import heapq
+import httpx
+from string import Template
 from datetime import datetime
 from fastapi import HTTPException, Request
-from typing import Dict, List, Any
+from typing import Dict, List, Any, AsyncIterator, Iterator, Optional, Tuple
+from itertools import islice
 
-from config import FACEBOOK_GRAPH_URL
-from models import get_page_token, page_exists, Conversation, Message
+from config import SEND_BULK_MAX_RECIPIENTS, SEND_BULK_CONCURRENCY, MESSAGE_PAGE_SIZE, GRAPH_REQUEST_DEADLINE
+from graph import graph_get, graph_batch, graph_paginate, batch_url, get_token_semaphore, GraphError
+from deadline import graph_deadline
+from models import get_page_token, page_exists, get_client_token, client_exists, ConversationRecord, MessageRecord
+from singleflight import singleflight
+from usage import throttle
+from log import get_logger
+from sender import SendJob, submit_send, wait_for_job, get_job
+from metrics import Counter
+from fields import CONVERSATION_FIELD_CHOICES, MESSAGE_FIELD_CHOICES, select_fields, graph_fields, check_page_size, project
+from store import (
+    save_conversations,
+    save_messages,
+    get_sync_state,
+    mark_conversations_synced,
+    mark_backfilled,
+    is_backfilled,
+    load_conversations,
+    load_unsynced_conversations,
+    load_messages,
+    iter_messages,
+)
 
-async def get_conversations(page_id: str) -> Dict[str, Any]:
-    """Get conversations for a page"""
+logger = get_logger("messaging")
+
+conversation_syncs = Counter(
+    "conversation_sync_total", "Conversations checked by a backfill, by whether their messages were fetched", ("result",)
+)
+
+# Default Graph fields; the store needs all of them
+MESSAGE_FIELDS = "id,created_time,from,to,message"
+CONVERSATION_FIELDS = "participants,updated_time,message_count,unread_count"
+
+def format_conversations(
+    conversation: Dict[str, Any],
+    page_id: str,
+    fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Format a Graph conversation as one entry per non-page participant, with only fields when given"""
+    conversations = []
+    participants = conversation.get("participants", {}).get("data", [])
+    for participant in participants:
+        if participant.get("id") != page_id:  # Exclude the page itself
+            conversations.append(project({
+                "conversation_id": conversation["id"],
+                "participant_psid": participant.get("id"),
+                "participant_name": participant.get("name", "Unknown"),
+                "updated_time": conversation.get("updated_time"),
+                "message_count": conversation.get("message_count", 0),
+                "unread_count": conversation.get("unread_count", 0)
+            }, fields, CONVERSATION_FIELD_CHOICES))
+    return conversations
+
+def format_message(
+    msg: Dict[str, Any],
+    conversation: Dict[str, Any],
+    fields: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Format a Graph message for the API response, with only fields when given"""
+    return project({
+        "conversation_id": conversation["id"],
+        "message_id": msg.get("id"),
+        "created_time": msg.get("created_time"),
+        "from": msg.get("from"),
+        "to": msg.get("to"),
+        "message": msg.get("message"),
+        "participants": conversation.get("participants", {}).get("data", [])
+    }, fields, MESSAGE_FIELD_CHOICES)
+
+async def get_conversations(page_id: str, refresh: bool = False, fields: Optional[str] = None) -> Dict[str, Any]:
+    """Get conversations for a page from the local store
+
+    fields, a comma-separated subset of CONVERSATION_FIELD_CHOICES, trims
+    the returned records; the store is always loaded with every field.
+    """
+    selected = select_fields(fields, CONVERSATION_FIELD_CHOICES, required=("participants",))
     if not page_exists(page_id):
         raise HTTPException(status_code=404, detail="Page not found or not authorized")
     
     page_token = get_page_token(page_id)
-    page_access_token = page_token["access_token"]
     
-    conversations_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/{page_id}/conversations?"
-        f"fields=participants,updated_time,message_count,unread_count&"
-        f"access_token={page_access_token}"
-    )
-    
-    if conversations_response.status_code != 200:
-        return {"error": "Failed to fetch conversations", "details": conversations_response.text}
+    # Load the page's conversation list from Graph once, or when a refresh is requested
+    if refresh or not is_backfilled(page_id):
+        with graph_deadline(GRAPH_REQUEST_DEADLINE):
+            backfill = await singleflight(
+                ("conversations", page_id), lambda: backfill_conversations(page_id, page_token)
+            )
+        if "error" in backfill:
+            return backfill
     
     conversations = []
-    for conversation in conversations_response.json().get("data", []):
-        participants = conversation.get("participants", {}).get("data", [])
-        for participant in participants:
-            if participant.get("id") != page_id:  # Exclude the page itself
-                conversations.append({
-                    "conversation_id": conversation["id"],
-                    "participant_psid": participant.get("id"),
-                    "participant_name": participant.get("name", "Unknown"),
-                    "updated_time": conversation.get("updated_time"),
-                    "message_count": conversation.get("message_count", 0),
-                    "unread_count": conversation.get("unread_count", 0)
-                })
-    
-    print(f"📝 Found {len(conversations)} conversations for page {page_token['name']}")
+    for conversation in load_conversations(page_id):
+        conversations.extend(format_conversations(conversation, page_id, selected))
+    
+    logger.info("Conversations loaded", extra={"page_id": page_id, "conversations": len(conversations)})
     
     return {
         "page_id": page_id,
@@ -46,69 +110,432 @@ async def get_conversations(page_id: str) -> Dict[str, Any]:
         "conversations": conversations
     }
 
-async def get_messages(page_id: str, limit: int = 25) -> Dict[str, Any]:
-    """Get messages for a page"""
+async def get_messages(
+    page_id: str,
+    limit: int = 25,
+    batch: bool = False,
+    refresh: bool = False,
+    delta: bool = False,
+    compact: bool = False,
+    fields: Optional[str] = None,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> Dict[str, Any]:
+    """Get the latest message_limit messages of each of a page's conversations
+
+    Served from the store. The page is loaded from Graph on first use or
+    with refresh; with delta, a refresh only refetches changed conversations.
+    """
+    selected = select_fields(fields, MESSAGE_FIELD_CHOICES)
+    check_page_size("limit", limit)
+    check_page_size("message_limit", message_limit)
     if not page_exists(page_id):
         raise HTTPException(status_code=404, detail="Page not found or not authorized")
     
     page_token = get_page_token(page_id)
-    page_access_token = page_token["access_token"]
     
-    # Get conversations
-    conversations_response = requests.get(
-        f"{FACEBOOK_GRAPH_URL}/{page_id}/conversations?"
-        f"fields=participants,updated_time,message_count,unread_count&"
-        f"limit={limit}&"
-        f"access_token={page_access_token}"
-    )
+    if refresh or not is_backfilled(page_id):
+        with graph_deadline(GRAPH_REQUEST_DEADLINE):
+            backfill = await coalesced_backfill(page_id, page_token, limit, batch, delta, message_limit)
+        if "error" in backfill:
+            return backfill
+        conversations = backfill["conversations"]
+        status = {
+            "failed_conversations": backfill["failed_conversations"],
+            "fetched_conversations": backfill["fetched_conversations"],
+            "unchanged_conversations": backfill["unchanged_conversations"],
+            "source": "graph"
+        }
+    else:
+        failed_conversations = []
+        if load_unsynced_conversations(page_id):
+            with graph_deadline(GRAPH_REQUEST_DEADLINE):
+                failed_conversations = await coalesced_sync(page_id, page_token, batch, message_limit)
+        conversations = load_conversations(page_id, limit)
+        status = {"failed_conversations": failed_conversations, "source": "store"}
     
-    if conversations_response.status_code != 200:
-        return {"error": "Failed to fetch conversations", "details": conversations_response.text}
+    if compact:
+        body = format_compact_messages(page_id, conversations, message_limit)
+    else:
+        body = format_page_messages(page_id, conversations, selected, message_limit)
     
-    conversations_data = conversations_response.json()
+    return {
+        "page_id": page_id,
+        "page_name": page_token["name"],
+        **body,
+        **status,
+        "retrieved_at": datetime.now().isoformat()
+    }
+
+def format_page_messages(
+    page_id: str,
+    conversations: List[Dict[str, Any]],
+    fields: Optional[List[str]] = None,
+    message_limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """List the latest stored messages of conversations, each carrying its conversation's participants"""
     messages_data = []
+    for conversation in conversations:
+        for msg in load_messages(page_id, conversation["id"], message_limit):
+            messages_data.append((msg.get("created_time") or "", format_message(msg, conversation, fields)))
     
-    # Get messages for each conversation
-    for conversation in conversations_data.get("data", []):
-        conversation_id = conversation["id"]
-        messages_response = requests.get(
-            f"{FACEBOOK_GRAPH_URL}/{conversation_id}/messages?"
-            f"fields=id,created_time,from,to,message&"
-            f"limit=50&"
-            f"access_token={page_access_token}"
+    # Sort messages chronologically
+    messages_data_sorted = [message for _, message in sorted(messages_data, key=lambda x: x[0])]
+    
+    return {
+        "total_conversations": len(conversations),
+        "total_messages": len(messages_data_sorted),
+        "messages": messages_data_sorted
+    }
+
+def format_compact_messages(
+    page_id: str,
+    conversations: List[Dict[str, Any]],
+    message_limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """List conversations once with their participants, and messages referring to them by id"""
+    conversation_records = [
+        ConversationRecord(
+            conversation["id"],
+            conversation.get("participants", {}).get("data", []),
+            conversation.get("updated_time"),
+            conversation.get("message_count", 0),
+            conversation.get("unread_count", 0)
         )
-        
-        if messages_response.status_code == 200:
-            messages = messages_response.json().get("data", [])
-            for msg in messages:
-                messages_data.append({
-                    "conversation_id": conversation_id,
-                    "message_id": msg.get("id"),
-                    "created_time": msg.get("created_time"),
-                    "from": msg.get("from"),
-                    "to": msg.get("to"),
-                    "message": msg.get("message"),
-                    "participants": conversation.get("participants", {}).get("data", [])
-                })
+        for conversation in conversations
+    ]
+    message_records = [
+        MessageRecord(
+            msg.get("id"),
+            record.id,
+            msg.get("created_time"),
+            (msg.get("from") or {}).get("id"),
+            [recipient.get("id") for recipient in (msg.get("to") or {}).get("data", [])],
+            msg.get("message")
+        )
+        for record in conversation_records
+        for msg in load_messages(page_id, record.id, message_limit)
+    ]
     
     # Sort messages chronologically
-    messages_data_sorted = sorted(messages_data, key=lambda x: x["created_time"] if x["created_time"] else "")
+    message_records.sort(key=lambda record: record.created_time or "")
     
     return {
-        "page_id": page_id,
-        "page_name": page_token["name"],
-        "total_conversations": len(conversations_data.get("data", [])),
-        "total_messages": len(messages_data_sorted),
-        "messages": messages_data_sorted,
-        "retrieved_at": datetime.now().isoformat()
+        "format": "compact",
+        "total_conversations": len(conversation_records),
+        "total_messages": len(message_records),
+        "conversations": [record._asdict() for record in conversation_records],
+        "messages": [record._asdict() for record in message_records]
     }
 
-async def send_message(page_id: str, request: Request) -> Dict[str, Any]:
-    """Send message from Facebook page"""
+async def coalesced_backfill(
+    page_id: str,
+    page_token: Dict[str, Any],
+    limit: int = 25,
+    batch: bool = False,
+    delta: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> Dict[str, Any]:
+    """Backfill a page, sharing one Graph call chain between concurrent callers"""
+    return await singleflight(
+        ("backfill", page_id, limit, batch, delta, message_limit),
+        lambda: backfill_messages(page_id, page_token, limit, batch, delta, message_limit)
+    )
+
+async def backfill_messages(
+    page_id: str,
+    page_token: Dict[str, Any],
+    limit: int = 25,
+    batch: bool = False,
+    delta: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> Dict[str, Any]:
+    """Load a page's recent conversations and messages from Graph into the store
+
+    Returns the Graph conversations with per-conversation fetch results,
+    or an error. Every conversation's messages are fetched unless delta
+    is set. With delta, they are fetched only for conversations whose
+    updated_time or message_count differ from when their messages were
+    last fetched, and the others are served from the store. A refresh then
+    costs 1 + (changed conversations) Graph calls instead of N + 1.
+    Conversations whose messages could not be fetched are fetched again
+    by later reads, through sync_unsynced_conversations.
+    """
+    backfill = await backfill_conversations(page_id, page_token, limit)
+    if "error" in backfill:
+        return backfill
+    conversations = backfill["conversations"]
+    
+    if delta:
+        sync_state = get_sync_state(page_id)
+        changed = [
+            conversation for conversation in conversations
+            if sync_state.get(conversation["id"]) != (conversation.get("updated_time"), conversation.get("message_count", 0))
+        ]
+    else:
+        changed = conversations
+    conversation_syncs.inc("fetched", amount=len(changed))
+    conversation_syncs.inc("unchanged", amount=len(conversations) - len(changed))
+    
+    synced, failed_conversations = await sync_conversations(
+        page_id, changed, page_token["access_token"], batch, message_limit
+    )
+    
+    # The store now holds the unchanged conversations' messages and the newly fetched ones
+    return {
+        "conversations": conversations,
+        "failed_conversations": failed_conversations,
+        "fetched_conversations": len(synced),
+        "unchanged_conversations": len(conversations) - len(changed)
+    }
+
+async def backfill_conversations(page_id: str, page_token: Dict[str, Any], limit: int = 25) -> Dict[str, Any]:
+    """Load a page's recent conversations from Graph into the store and mark the page backfilled
+
+    Their messages are left to backfill_messages, or to the next message
+    read through sync_unsynced_conversations.
+    """
+    # Never from the response cache, which would hide changes from the delta check
+    conversations_response = await graph_get(
+        f"/{page_id}/conversations",
+        params={
+            "fields": CONVERSATION_FIELDS,
+            "limit": limit,
+            "access_token": page_token["access_token"]
+        },
+        owner_id=page_id
+    )
+    
+    if conversations_response.status_code != 200:
+        return {"error": "Failed to fetch conversations", "details": conversations_response.text}
+    
+    conversations = conversations_response.json().get("data", [])
+    save_conversations(page_id, conversations)
+    mark_backfilled(page_id)
+    return {"conversations": conversations}
+
+async def coalesced_sync(
+    page_id: str,
+    page_token: Dict[str, Any],
+    batch: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> List[Dict[str, Any]]:
+    """Sync a page's unsynced conversations, sharing one Graph call chain between concurrent callers"""
+    return await singleflight(
+        ("sync", page_id, batch, message_limit),
+        lambda: sync_unsynced_conversations(page_id, page_token, batch, message_limit)
+    )
+
+async def sync_unsynced_conversations(
+    page_id: str,
+    page_token: Dict[str, Any],
+    batch: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> List[Dict[str, Any]]:
+    """Fetch the messages of stored conversations that have never had them fetched, returning the failures
+
+    These are conversations whose fetch failed in an earlier backfill, or
+    that were loaded by get_conversations. Only they are fetched, so a
+    conversation that keeps failing costs one Graph call per read, not
+    a reload of the whole page.
+    """
+    conversations = load_unsynced_conversations(page_id)
+    _, failed_conversations = await sync_conversations(
+        page_id, conversations, page_token["access_token"], batch, message_limit
+    )
+    return failed_conversations
+
+async def sync_conversations(
+    page_id: str,
+    conversations: List[Dict[str, Any]],
+    page_access_token: str,
+    batch: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Fetch and store the messages of conversations, marking them synced
+
+    Returns the conversations that were synced and a failure record for
+    each of the others.
+    """
+    # Concurrently, or in Graph batches
+    conversation_ids = [conversation["id"] for conversation in conversations]
+    results = await fetch_messages_for_conversations(page_id, conversation_ids, page_access_token, batch, message_limit)
+    
+    synced = []
+    failed_conversations = []
+    for conversation, (status_code, body) in zip(conversations, results):
+        conversation_id = conversation["id"]
+        
+        if status_code != 200:
+            failed_conversations.append({
+                "conversation_id": conversation_id,
+                "status_code": status_code,
+                "details": body
+            })
+            continue
+        
+        save_messages(page_id, conversation_id, body.get("data", []))
+        synced.append(conversation)
+    
+    mark_conversations_synced(synced)
+    return synced, failed_conversations
+
+async def fetch_messages_for_conversations(
+    page_id: str,
+    conversation_ids: List[str],
+    page_access_token: str,
+    batch: bool = False,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> List[Tuple[Optional[int], Any]]:
+    """Fetch the latest messages of each conversation
+
+    Returns one (status_code, body) pair per conversation, where body is
+    the parsed Graph response on success and the error details otherwise.
+    """
+    message_params = {"fields": MESSAGE_FIELDS, "limit": message_limit}
+    if batch:
+        await throttle(page_id)
+        return await graph_batch(
+            [batch_url(f"/{conversation_id}/messages", message_params) for conversation_id in conversation_ids],
+            page_access_token,
+            owner_id=page_id
+        )
+    
+    semaphore = get_token_semaphore(page_access_token)
+    
+    async def fetch(conversation_id: str) -> Tuple[Optional[int], Any]:
+        try:
+            async with semaphore:
+                await throttle(page_id)
+                response = await graph_get(
+                    f"/{conversation_id}/messages",
+                    params={**message_params, "access_token": page_access_token},
+                    owner_id=page_id
+                )
+        except httpx.HTTPError as e:
+            return None, str(e)
+        if response.status_code != 200:
+            return response.status_code, response.text
+        return response.status_code, response.json()
+    
+    return await asyncio.gather(*(fetch(conversation_id) for conversation_id in conversation_ids))
+
+def stream_conversations(
+    page_id: str,
+    after: Optional[str] = None,
+    limit: int = 100,
+    fields: Optional[str] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every conversation of a page, following Graph pagination
+
+    Yields conversation records as each Graph page arrives, followed by a
+    {"next_cursor": ...} record whenever more pages remain; pass that
+    cursor as after to resume. fields, a subset of
+    CONVERSATION_FIELD_CHOICES, is requested from Graph as is.
+    """
+    selected = select_fields(fields, CONVERSATION_FIELD_CHOICES, required=("participants",))
+    check_page_size("limit", limit)
     if not page_exists(page_id):
         raise HTTPException(status_code=404, detail="Page not found or not authorized")
     
-    data = await request.json()
+    page_access_token = get_page_token(page_id)["access_token"]
+    
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        pages = graph_paginate(
+            f"/{page_id}/conversations",
+            params={
+                "fields": graph_fields(selected, CONVERSATION_FIELDS),
+                "limit": limit,
+                "access_token": page_access_token
+            },
+            after=after,
+            owner_id=page_id
+        )
+        try:
+            async for conversations, next_after in pages:
+                for conversation in conversations:
+                    for record in format_conversations(conversation, page_id, selected):
+                        yield record
+                if next_after:
+                    yield {"next_cursor": next_after}
+        except GraphError as e:
+            yield {"error": "Failed to fetch conversations", "details": e.details}
+    
+    return records()
+
+def stream_messages(
+    page_id: str,
+    after: Optional[str] = None,
+    limit: int = 25,
+    fields: Optional[str] = None,
+    message_limit: int = MESSAGE_PAGE_SIZE
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream every message of every conversation of a page
+
+    Conversations and their messages are both fully paginated, limit and
+    message_limit per Graph page. Records are yielded per conversation as
+    Graph pages arrive, and a {"next_cursor": ...} record follows each
+    completed page of conversations; pass that cursor as after to resume.
+    Conversations whose messages fail are reported with an error record.
+    fields, a subset of MESSAGE_FIELD_CHOICES, is requested from Graph as is.
+    """
+    selected = select_fields(fields, MESSAGE_FIELD_CHOICES)
+    check_page_size("limit", limit)
+    check_page_size("message_limit", message_limit)
+    if not page_exists(page_id):
+        raise HTTPException(status_code=404, detail="Page not found or not authorized")
+    
+    page_access_token = get_page_token(page_id)["access_token"]
+    
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        pages = graph_paginate(
+            f"/{page_id}/conversations",
+            # Message records only carry each conversation's participants
+            params={"fields": "participants", "limit": limit, "access_token": page_access_token},
+            after=after,
+            owner_id=page_id
+        )
+        try:
+            async for conversations, next_after in pages:
+                for conversation in conversations:
+                    message_pages = graph_paginate(
+                        f"/{conversation['id']}/messages",
+                        params={
+                            "fields": graph_fields(selected, MESSAGE_FIELDS),
+                            "limit": message_limit,
+                            "access_token": page_access_token
+                        },
+                        owner_id=page_id
+                    )
+                    try:
+                        async for messages, _ in message_pages:
+                            for msg in messages:
+                                yield format_message(msg, conversation, selected)
+                    except GraphError as e:
+                        yield {
+                            "conversation_id": conversation["id"],
+                            "error": "Failed to fetch messages",
+                            "details": e.details
+                        }
+                if next_after:
+                    yield {"next_cursor": next_after}
+        except GraphError as e:
+            yield {"error": "Failed to fetch conversations", "details": e.details}
+    
+    return records()
+
+async def send_message(page_id: str, request: Request, wait: bool = True) -> Dict[str, Any]:
+    """Send message from Facebook page
+
+    The message goes through the send scheduler. With wait set the final
+    result is returned; otherwise the job id is returned right away and
+    can be polled with get_send_job.
+    """
+    if not page_exists(page_id):
+        raise HTTPException(status_code=404, detail="Page not found or not authorized")
+    
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Request body must be an object")
     recipient_psid = data.get("recipient_id")
     message_text = data.get("message")
     
@@ -118,49 +545,225 @@ async def send_message(page_id: str, request: Request) -> Dict[str, Any]:
     page_token = get_page_token(page_id)
     page_access_token = page_token["access_token"]
     
-    # Prepare message payload
-    message_payload = {
-        "recipient": {"id": recipient_psid},
-        "message": {"text": message_text},
-        "messaging_type": "RESPONSE"
-    }
+    logger.info("Queueing message", extra={"page_id": page_id, "recipient_psid": recipient_psid})
     
-    print(f"\n📤 Attempting to send message:")
-    print(f" Page: {page_token['name']} ({page_id})")
-    print(f" To PSID: {recipient_psid}")
-    print(f" Message: {message_text}")
+    job = submit_send(page_id, recipient_psid, message_text, page_access_token)
+    if wait:
+        await wait_for_job(job)
     
-    # Send message
-    send_response = requests.post(
-        f"{FACEBOOK_GRAPH_URL}/me/messages",
-        json=message_payload,
-        params={"access_token": page_access_token}
-    )
+    return format_send_job(job, page_token)
+
+async def send_bulk_messages(page_id: str, request: Request) -> AsyncIterator[Dict[str, Any]]:
+    """Send many messages from a page, streaming per-recipient results
+
+    The body holds either "messages", a list of {"recipient_id",
+    "message"}, or a "template" with $placeholders plus "recipients", a
+    list of PSIDs or {"recipient_id", "variables"} objects. Sends go
+    through the send scheduler, at most SEND_BULK_CONCURRENCY queued at
+    once. Results are yielded as they finish, each with the index of its
+    input, followed by a summary record.
+    """
+    if not page_exists(page_id):
+        raise HTTPException(status_code=404, detail="Page not found or not authorized")
+    
+    items = build_bulk_items(await read_json(request))
+    
+    page_token = get_page_token(page_id)
+    page_access_token = page_token["access_token"]
+    
+    logger.info("Queueing bulk send", extra={"page_id": page_id, "messages": len(items)})
     
-    print(f"📊 Response Status: {send_response.status_code}")
-    print(f"📋 Response Body: {send_response.text}")
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        summary = {"total": len(items), "sent": 0, "failed": 0}
+        waiting = {}
+        next_index = 0
+        
+        def fill() -> List[Dict[str, Any]]:
+            nonlocal next_index
+            rejected = []
+            while len(waiting) < SEND_BULK_CONCURRENCY and next_index < len(items):
+                index = next_index
+                next_index += 1
+                recipient_psid, message_text = items[index]
+                if not recipient_psid or not message_text:
+                    rejected.append({
+                        "index": index,
+                        "error": "recipient_id (PSID) and message are required; check template variables"
+                    })
+                    continue
+                try:
+                    job = submit_send(page_id, recipient_psid, message_text, page_access_token)
+                except HTTPException as e:
+                    rejected.append({"index": index, "recipient_psid": recipient_psid, "error": e.detail})
+                    continue
+                waiting[asyncio.ensure_future(wait_for_job(job))] = index
+            return rejected
+        
+        while True:
+            for record in fill():
+                summary["failed"] += 1
+                yield record
+            if not waiting:
+                break
+            
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = waiting.pop(task)
+                job = task.result()
+                summary["sent" if job.status == "sent" else "failed"] += 1
+                yield {"index": index, **format_send_job(job, page_token)}
+        
+        yield {"summary": summary}
+    
+    return records()
+
+async def read_json(request: Request) -> Any:
+    """Parse a request's JSON body, rejecting a malformed one with a 400"""
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be JSON")
+
+def build_bulk_items(data: Dict[str, Any]) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Expand a bulk send body into (recipient_id, message) pairs"""
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Request body must be an object")
     
-    if send_response.status_code != 200:
-        error_details = send_response.json() if send_response.text else "No error details"
-        print(f"❌ Send failed: {error_details}")
+    if "messages" in data:
+        messages = data["messages"]
+        if not isinstance(messages, list):
+            raise HTTPException(status_code=400, detail="messages must be a list")
+        items = []
+        for index, msg in enumerate(messages):
+            if not isinstance(msg, dict):
+                raise HTTPException(status_code=400, detail=f"messages[{index}] must be an object")
+            items.append((msg.get("recipient_id"), msg.get("message")))
+    elif "template" in data and "recipients" in data:
+        if not isinstance(data["template"], str):
+            raise HTTPException(status_code=400, detail="template must be a string")
+        template = Template(data["template"])
+        recipients = data["recipients"]
+        if not isinstance(recipients, list):
+            raise HTTPException(status_code=400, detail="recipients must be a list")
+        items = []
+        for index, recipient in enumerate(recipients):
+            if isinstance(recipient, dict):
+                recipient_psid = recipient.get("recipient_id")
+                extra_variables = recipient.get("variables", {})
+                if not isinstance(extra_variables, dict):
+                    raise HTTPException(status_code=400, detail=f"recipients[{index}].variables must be an object")
+                variables = {"recipient_id": recipient_psid, **extra_variables}
+            else:
+                recipient_psid = recipient
+                variables = {"recipient_id": recipient_psid}
+            try:
+                message_text = template.substitute(variables)
+            except (KeyError, ValueError):
+                message_text = None
+            items.append((recipient_psid, message_text))
+    else:
+        raise HTTPException(status_code=400, detail="messages, or template and recipients, are required")
+    
+    if len(items) > SEND_BULK_MAX_RECIPIENTS:
+        raise HTTPException(status_code=400, detail=f"At most {SEND_BULK_MAX_RECIPIENTS} messages per request")
+    return items
+
+async def get_send_job(page_id: str, job_id: str) -> Dict[str, Any]:
+    """Get the status or result of a queued send"""
+    job = get_job(job_id)
+    if job is None or job.page_id != page_id:
+        raise HTTPException(status_code=404, detail="Send job not found")
+    return format_send_job(job, get_page_token(page_id))
+
+def format_send_job(job: SendJob, page_token: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a send job's status or final result"""
+    if job.status == "sent":
         return {
-            "error": "Failed to send message",
-            "status_code": send_response.status_code,
-            "details": error_details,
-            "page_id": page_id,
-            "recipient_psid": recipient_psid
+            "success": True,
+            "message_sent": job.message_text,
+            "recipient_psid": job.recipient_id,
+            "page_id": job.page_id,
+            "page_name": page_token["name"],
+            "message_id": job.response_body.get("message_id"),
+            "sent_at": job.finished_at,
+            "job_id": job.job_id,
+            "attempts": job.attempts
         }
     
-    response_data = send_response.json()
-    message_id = response_data.get("message_id")
-    print(f"✅ Message sent successfully! Message ID: {message_id}")
+    if job.status == "failed":
+        return {
+            "error": "Failed to send message",
+            "status_code": job.status_code,
+            "details": job.response_body or job.error or "No error details",
+            "page_id": job.page_id,
+            "recipient_psid": job.recipient_id,
+            "job_id": job.job_id,
+            "attempts": job.attempts
+        }
     
     return {
-        "success": True,
-        "message_sent": message_text,
-        "recipient_psid": recipient_psid,
-        "page_id": page_id,
-        "page_name": page_token["name"],
-        "message_id": message_id,
-        "sent_at": datetime.now().isoformat()
+        "job_id": job.job_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "page_id": job.page_id,
+        "recipient_psid": job.recipient_id,
+        "queued_at": job.created_at
     }
+
+def stream_inbox(client_id: str, limit: int = 50, refresh: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Stream the newest messages across all of a client's pages, newest first
+
+    Pages not yet in the store (or all pages, with refresh) are backfilled
+    concurrently first, and conversations whose messages were never
+    fetched are synced, within GRAPH_REQUEST_DEADLINE; pages that fail are
+    reported with an error record.
+    The feed is a k-way merge of the per-conversation message streams,
+    each already ordered in the store, stopped after limit messages. Only
+    each page's limit most recently updated conversations can hold a top
+    message, so no other conversation is read.
+    """
+    check_page_size("limit", limit)
+    if not client_exists(client_id):
+        raise HTTPException(status_code=404, detail="Client not connected")
+    
+    page_ids = [page["id"] for page in get_client_token(client_id).get("pages", []) if page_exists(page["id"])]
+    
+    async def records() -> AsyncIterator[Dict[str, Any]]:
+        page_tokens = {page_id: get_page_token(page_id) for page_id in page_ids}
+        stale = [page_id for page_id in page_ids if refresh or not is_backfilled(page_id)]
+        unsynced = [page_id for page_id in page_ids if page_id not in stale and load_unsynced_conversations(page_id)]
+        with graph_deadline(GRAPH_REQUEST_DEADLINE):
+            backfills = await asyncio.gather(
+                *(coalesced_backfill(page_id, page_tokens[page_id]) for page_id in stale),
+                *(coalesced_sync(page_id, page_tokens[page_id]) for page_id in unsynced),
+                return_exceptions=True
+            )
+        for page_id, backfill in zip(stale + unsynced, backfills):
+            if isinstance(backfill, httpx.HTTPError):
+                yield {"page_id": page_id, "error": "Failed to fetch conversations", "details": str(backfill)}
+            elif isinstance(backfill, BaseException):
+                raise backfill
+            elif isinstance(backfill, dict) and "error" in backfill:
+                yield {"page_id": page_id, "error": backfill["error"], "details": backfill.get("details")}
+        
+        streams = []
+        for page_id in page_ids:
+            page_name = page_tokens[page_id]["name"]
+            for conversation in load_conversations(page_id, limit):
+                streams.append(inbox_stream(page_id, page_name, conversation))
+        
+        feed = heapq.merge(*streams, key=lambda record: record["created_time"] or "", reverse=True)
+        try:
+            for record in islice(feed, limit):
+                yield record
+        finally:
+            # Release the store cursors of streams that were not read to the end
+            for stream in streams:
+                stream.close()
+    
+    return records()
+
+def inbox_stream(page_id: str, page_name: str, conversation: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield a stored conversation's messages as inbox records, newest first"""
+    for msg in iter_messages(page_id, conversation["id"]):
+        yield {"page_id": page_id, "page_name": page_name, **format_message(msg, conversation)}
@@ -0,0 +1,159 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Any, Optional, Sequence, Tuple, Union
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Latency buckets in seconds, shared by every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Every metric exported at /metrics, in registration order
+_registry: List[Any] = []
+
+def _escape(value: Any) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    """Format a label set, e.g. {route="/x",method="GET"}"""
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels: Any, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Histogram with fixed buckets and labels"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts (last one is +Inf), sum, count]
+        self._values: Dict[Tuple, List[Any]] = {}
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: Any):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Callback:
+    """Gauge or counter read from another module's state at scrape time
+    
+    read returns a single value, or a dict of label value tuples to values.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], Union[float, Dict[Tuple, float]]],
+        labelnames: Sequence[str] = (),
+        kind: str = "gauge"
+    ):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        values = self.read()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {float(value)}")
+        return lines
+
+def render_metrics() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests handled, by route and status", ("method", "route", "status")
+)
+http_errors = Counter(
+    "http_request_errors_total", "HTTP requests that failed with a 5xx or an exception", ("method", "route")
+)
+http_latency = Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers, by route", ("method", "route")
+)
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording count, errors and latency per route template
+    
+    Status and latency are taken from the http.response.start message, so
+    streamed bodies are neither buffered nor counted in the latency. A
+    request that fails before its headers are sent counts as a 500.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        status: Optional[int] = None
+        elapsed = 0.0
+
+        async def send_wrapper(message: Message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - started
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if status is None:
+                status = 500
+                elapsed = time.perf_counter() - started
+            method = scope["method"]
+            route_path = getattr(scope.get("route"), "path", "unmatched")
+            http_latency.observe(elapsed, method, route_path)
+            http_requests.inc(method, route_path, status)
+            if status >= 500:
+                http_errors.inc(method, route_path)
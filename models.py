@@ -1,10 +1,13 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, NamedTuple, Tuple
 from dataclasses import dataclass, asdict
 
-# In-memory storage (replace with database in production)
-client_tokens: Dict[str, Any] = {}
-page_tokens: Dict[str, Any] = {}
+from config import TOKEN_STORE_BACKEND, TOKEN_STORE_PATH, TOKEN_CACHE_TTL
 
 @dataclass
 class FacebookProfile:
@@ -50,26 +53,162 @@ class Message:
     message: str
     participants: List[Dict[str, Any]]
 
+class ConversationRecord(NamedTuple):
+    """A conversation listed once in a compact messages response"""
+    id: str
+    participants: List[Dict[str, Any]]
+    updated_time: Optional[str]
+    message_count: int
+    unread_count: int
+
+class MessageRecord(NamedTuple):
+    """A message in a compact response, referring to its conversation and participants by id"""
+    id: str
+    conversation_id: str
+    created_time: Optional[str]
+    from_id: Optional[str]
+    to_ids: List[str]
+    message: Optional[str]
+
+class TokenStore(ABC):
+    """Storage backend for client and page tokens, keyed by kind and id"""
+
+    @abstractmethod
+    def put(self, kind: str, key: str, data: Dict[str, Any]):
+        """Store data under kind and key, replacing what was there"""
+
+    @abstractmethod
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get the data under kind and key, or None"""
+
+    @abstractmethod
+    def items(self, kind: str) -> List[Tuple[str, Dict[str, Any]]]:
+        """List the (key, data) pairs of a kind"""
+
+class MemoryTokenStore(TokenStore):
+    """Tokens held in this process only"""
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def put(self, kind: str, key: str, data: Dict[str, Any]):
+        self._data[(kind, key)] = data
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._data.get((kind, key))
+
+    def items(self, kind: str) -> List[Tuple[str, Dict[str, Any]]]:
+        return [(key, data) for (data_kind, key), data in self._data.items() if data_kind == kind]
+
+class SQLiteTokenStore(TokenStore):
+    """Tokens persisted in SQLite (WAL mode), shared by all worker processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, updated_at TEXT NOT NULL, "
+                "PRIMARY KEY (kind, key))"
+            )
+            self._local.conn = conn
+        return conn
+
+    def put(self, kind: str, key: str, data: Dict[str, Any]):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tokens (kind, key, data, updated_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(data), datetime.now().isoformat())
+            )
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT data FROM tokens WHERE kind = ? AND key = ?", (kind, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def items(self, kind: str) -> List[Tuple[str, Dict[str, Any]]]:
+        rows = self._connection().execute(
+            "SELECT key, data FROM tokens WHERE kind = ? ORDER BY key", (kind,)
+        ).fetchall()
+        return [(key, json.loads(data)) for key, data in rows]
+
+class CachedTokenStore(TokenStore):
+    """Read-through in-process cache in front of another token store
+
+    Entries are trusted for ttl seconds, so tokens written by other
+    workers become visible here within that time. Writes go through.
+    """
+
+    def __init__(self, backend: TokenStore, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self._cache: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+
+    def put(self, kind: str, key: str, data: Dict[str, Any]):
+        self.backend.put(kind, key, data)
+        self._cache[(kind, key)] = (time.monotonic() + self.ttl, data)
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get((kind, key))
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        data = self.backend.get(kind, key)
+        if data is None:
+            self._cache.pop((kind, key), None)
+        else:
+            self._cache[(kind, key)] = (time.monotonic() + self.ttl, data)
+        return data
+
+    def items(self, kind: str) -> List[Tuple[str, Dict[str, Any]]]:
+        return self.backend.items(kind)
+
+def create_token_store() -> TokenStore:
+    """Create the token store selected by TOKEN_STORE_BACKEND"""
+    if TOKEN_STORE_BACKEND == "memory":
+        return MemoryTokenStore()
+    if TOKEN_STORE_BACKEND == "sqlite":
+        return CachedTokenStore(SQLiteTokenStore(TOKEN_STORE_PATH), TOKEN_CACHE_TTL)
+    raise ValueError(f"Unknown TOKEN_STORE_BACKEND: {TOKEN_STORE_BACKEND}")
+
+token_store: TokenStore = create_token_store()
+
+def set_token_store(store: TokenStore):
+    """Replace the token store, e.g. with a custom backend"""
+    global token_store
+    token_store = store
+
 def store_client_token(client_id: str, token_data: ClientToken):
     """Store client token data"""
-    client_tokens[client_id] = asdict(token_data)
+    token_store.put("client", client_id, asdict(token_data))
 
 def store_page_token(page_id: str, token_data: PageToken):
     """Store page token data"""
-    page_tokens[page_id] = asdict(token_data)
+    token_store.put("page", page_id, asdict(token_data))
 
 def get_client_token(client_id: str) -> Optional[Dict[str, Any]]:
     """Get client token data"""
-    return client_tokens.get(client_id)
+    return token_store.get("client", client_id)
 
 def get_page_token(page_id: str) -> Optional[Dict[str, Any]]:
     """Get page token data"""
-    return page_tokens.get(page_id)
+    return token_store.get("page", page_id)
+
+def list_page_tokens() -> List[Tuple[str, Dict[str, Any]]]:
+    """List (page_id, page token data) for every connected page"""
+    return token_store.items("page")
 
 def client_exists(client_id: str) -> bool:
     """Check if client exists"""
-    return client_id in client_tokens
+    return get_client_token(client_id) is not None
 
 def page_exists(page_id: str) -> bool:
     """Check if page exists"""
-    return page_id in page_tokens
+    return get_page_token(page_id) is not None
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import json
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from typing import Any, Dict, Tuple
+
+from config import RESPONSE_COMPRESS_MIN_BYTES, RESPONSE_GZIP_LEVEL, RESPONSE_BROTLI_QUALITY
+from metrics import Counter
+
+# orjson and brotli are optional; without them responses use json and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Fields that change on every call without the data changing; left out of ETags
+VOLATILE_FIELDS = ("retrieved_at",)
+
+conditional_responses = Counter(
+    "http_conditional_responses_total", "Read responses by ETag outcome and content encoding", ("outcome", "encoding")
+)
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def compute_etag(body: bytes) -> str:
+    """Weak ETag over serialized content"""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def render_with_etag(content: Any) -> Tuple[bytes, str]:
+    """Serialize content once, returning the body and its ETag
+    
+    Top-level VOLATILE_FIELDS are left out of the hashed bytes and
+    appended to the body after them, so the rest is serialized only once.
+    """
+    if not isinstance(content, dict) or not any(key in content for key in VOLATILE_FIELDS):
+        body = dumps(content)
+        return body, compute_etag(body)
+    
+    stable = dumps({key: value for key, value in content.items() if key not in VOLATILE_FIELDS})
+    volatile = dumps({key: value for key, value in content.items() if key in VOLATILE_FIELDS})
+    # Both are JSON objects: join them by dropping the brace between
+    body = stable[:-1] + b"," + volatile[1:] if stable != b"{}" else volatile
+    return body, compute_etag(stable)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check whether If-None-Match names the ETag (compared weakly) or is *"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return "*" in candidates or any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == bare for candidate in candidates
+    )
+
+def _accepts(request: Request, encoding: str) -> bool:
+    """Check whether Accept-Encoding allows an encoding (q=0 excluded)"""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+def json_response(request: Request, content: Any) -> Response:
+    """Serve JSON with an ETag, answering 304 when the client already has it
+    
+    Bodies of RESPONSE_COMPRESS_MIN_BYTES or more are compressed with
+    brotli (when installed) or gzip, as the client accepts.
+    """
+    body, etag = render_with_etag(content)
+    headers: Dict[str, str] = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    
+    if etag_matches(request, etag):
+        conditional_responses.inc("not_modified", "identity")
+        return Response(status_code=304, headers=headers)
+    
+    encoding = "identity"
+    if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        if brotli is not None and _accepts(request, "br"):
+            body, encoding = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), "br"
+        elif _accepts(request, "gzip"):
+            body, encoding = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL), "gzip"
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    
+    conditional_responses.inc("full", encoding)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,16 +1,63 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import RedirectResponse
+import httpx
+from fastapi import FastAPI, Request, HTTPException, WebSocket
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse, JSONResponse
+from typing import Dict, Any, AsyncIterator, Optional
+from math import ceil
 
+from config import MESSAGE_PAGE_SIZE, LIVE_ENABLED
 from auth import generate_oauth_url, handle_oauth_callback
-from messaging import get_conversations, get_messages, send_message
-from leads import get_facebook_leads
-from webhook import verify_webhook, handle_webhook
+from messaging import get_conversations, get_messages, send_message, send_bulk_messages, get_send_job, stream_conversations, stream_messages, stream_inbox
+from leads import get_facebook_leads, stream_facebook_leads, sync_leads
+from webhook import verify_webhook, handle_webhook, get_webhook_queue_stats
 from debug import debug_page_setup
-from models import get_client_token, client_exists, page_tokens
+from models import get_client_token, client_exists, page_exists, list_page_tokens
+from cache import graph_cache
+from graph import GraphUnavailable, GraphDeadlineExceeded
+from breaker import graph_breaker
+from usage import get_usage
+from metrics import render_metrics
+from health import is_ready, get_health
+from responses import json_response, dumps
+from live import Subscription, subscribe, page_topic, client_topic, sse_stream, serve_websocket, get_live_stats
+
+def ndjson_response(records: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Stream records as newline-delimited JSON"""
+    async def lines():
+        async for record in records:
+            yield dumps(record) + b"\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def sse_response(subscription: Subscription) -> StreamingResponse:
+    """Stream a live subscription as Server-Sent Events"""
+    return StreamingResponse(
+        sse_stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 def setup_routes(app: FastAPI):
     """Set up all API routes"""
     
+    @app.exception_handler(GraphUnavailable)
+    async def graph_unavailable(request: Request, exc: GraphUnavailable):
+        """Fail fast with 503 while the Graph circuit breaker is open"""
+        return JSONResponse(
+            {"error": "Facebook Graph API unavailable", "details": str(exc)},
+            status_code=503,
+            headers={"Retry-After": str(max(1, ceil(graph_breaker.retry_after())))}
+        )
+    
+    @app.exception_handler(GraphDeadlineExceeded)
+    async def graph_deadline_exceeded(request: Request, exc: GraphDeadlineExceeded):
+        """Answer 504 when Graph did not respond within the request's deadline"""
+        return JSONResponse({"error": "Facebook Graph API timed out", "details": str(exc)}, status_code=504)
+    
+    @app.exception_handler(httpx.HTTPError)
+    async def graph_request_failed(request: Request, exc: httpx.HTTPError):
+        """Answer 502 when a Graph call failed without a response"""
+        return JSONResponse({"error": "Facebook Graph API request failed", "details": str(exc)}, status_code=502)
+    
     @app.get("/")
     async def root():
         return {"message": "Facebook CRM Integration Server with Terminal Messaging - Running!"}
@@ -27,40 +74,94 @@ def setup_routes(app: FastAPI):
         return await handle_oauth_callback(request)
     
     @app.get("/pages/{client_id}")
-    async def get_client_pages(client_id: str):
+    async def get_client_pages(client_id: str, request: Request):
         """Get all pages for a client"""
         if not client_exists(client_id):
             return {"error": "Client not connected"}
         
         client_token = get_client_token(client_id)
-        return {
+        return json_response(request, {
             "client_id": client_id,
             "pages": client_token.get("pages", [])
-        }
+        })
+    
+    @app.get("/inbox/{client_id}")
+    async def get_client_inbox(client_id: str, limit: int = 50, refresh: bool = False):
+        """Stream the newest messages across all of a client's pages as NDJSON"""
+        return ndjson_response(stream_inbox(client_id, limit, refresh))
     
     @app.get("/conversations/{page_id}")
-    async def get_page_conversations_with_psids(page_id: str):
+    async def get_page_conversations_with_psids(
+        page_id: str,
+        request: Request,
+        refresh: bool = False,
+        fields: Optional[str] = None
+    ):
         """Get conversations with PSIDs"""
-        return await get_conversations(page_id)
+        return json_response(request, await get_conversations(page_id, refresh, fields))
+    
+    @app.get("/conversations/{page_id}/stream")
+    async def stream_page_conversations(
+        page_id: str,
+        after: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[str] = None
+    ):
+        """Stream all conversations as NDJSON"""
+        return ndjson_response(stream_conversations(page_id, after, limit, fields))
     
     @app.get("/messages/{page_id}")
-    async def get_page_messages(page_id: str, limit: int = 25):
+    async def get_page_messages(
+        page_id: str,
+        request: Request,
+        limit: int = 25,
+        batch: bool = False,
+        refresh: bool = False,
+        delta: bool = False,
+        compact: bool = False,
+        fields: Optional[str] = None,
+        message_limit: int = MESSAGE_PAGE_SIZE
+    ):
         """Get messages for a page"""
-        return await get_messages(page_id, limit)
+        return json_response(
+            request, await get_messages(page_id, limit, batch, refresh, delta, compact, fields, message_limit)
+        )
+    
+    @app.get("/messages/{page_id}/stream")
+    async def stream_page_messages(
+        page_id: str,
+        after: Optional[str] = None,
+        limit: int = 25,
+        fields: Optional[str] = None,
+        message_limit: int = MESSAGE_PAGE_SIZE
+    ):
+        """Stream all messages as NDJSON"""
+        return ndjson_response(stream_messages(page_id, after, limit, fields, message_limit))
     
     @app.post("/messages/{page_id}/send")
-    async def send_page_message(page_id: str, request: Request):
+    async def send_page_message(page_id: str, request: Request, wait: bool = True):
         """Send message from Facebook page"""
-        return await send_message(page_id, request)
+        return await send_message(page_id, request, wait)
+    
+    @app.post("/messages/{page_id}/send/bulk")
+    async def send_page_messages_bulk(page_id: str, request: Request):
+        """Send many messages from a page, streaming results as NDJSON"""
+        return ndjson_response(await send_bulk_messages(page_id, request))
+    
+    @app.get("/messages/{page_id}/send/{job_id}")
+    async def get_page_send_job(page_id: str, job_id: str):
+        """Get the status of a queued message"""
+        return await get_send_job(page_id, job_id)
     
     @app.get("/terminal/pages")
     async def list_pages_for_terminal():
         """List pages for terminal interface"""
+        page_tokens = list_page_tokens()
         if not page_tokens:
             return {"error": "No pages connected. Please complete OAuth first."}
         
         pages_list = []
-        for page_id, page_data in page_tokens.items():
+        for page_id, page_data in page_tokens:
             pages_list.append({
                 "page_id": page_id,
                 "page_name": page_data["name"],
@@ -72,10 +173,11 @@ def setup_routes(app: FastAPI):
     @app.get("/terminal/conversations/{page_id}")
     async def list_conversations_for_terminal(page_id: str):
         """List conversations for terminal"""
-        if page_id not in page_tokens:
+        if not page_exists(page_id):
             return {"error": "Page not found"}
         
-        conversations_data = await get_conversations(page_id)
+        # Only what the terminal shows
+        conversations_data = await get_conversations(page_id, fields="participants,updated_time,message_count")
         if "error" in conversations_data:
             return conversations_data
         
@@ -95,15 +197,51 @@ def setup_routes(app: FastAPI):
         }
     
     @app.get("/leads/{client_id}")
-    async def get_leads(client_id: str, limit: int = 25):
+    async def get_leads(
+        client_id: str,
+        request: Request,
+        limit: int = 25,
+        batch: bool = False,
+        fields: Optional[str] = None
+    ):
         """Get Facebook leads"""
-        return await get_facebook_leads(client_id, limit)
+        return json_response(request, await get_facebook_leads(client_id, limit, batch, fields))
+    
+    @app.get("/leads/{client_id}/stream")
+    async def stream_leads(
+        client_id: str,
+        after: Optional[str] = None,
+        limit: int = 100,
+        fields: Optional[str] = None
+    ):
+        """Stream all Facebook leads as NDJSON"""
+        return ndjson_response(stream_facebook_leads(client_id, after, limit, fields))
+    
+    @app.post("/leads/{client_id}/sync")
+    async def sync_client_leads(client_id: str, limit: int = 100):
+        """Fetch leads created since the last sync into the local store"""
+        return await sync_leads(client_id, limit)
     
     @app.get("/debug/{page_id}")
     async def debug_page(page_id: str):
         """Debug page setup"""
         return await debug_page_setup(page_id)
     
+    @app.get("/cache/stats")
+    async def cache_stats():
+        """Get Graph response cache counters"""
+        return graph_cache.stats()
+    
+    @app.get("/metrics")
+    async def metrics():
+        """Export metrics in the Prometheus text format"""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+    
+    @app.get("/usage")
+    async def graph_usage():
+        """Get the recorded Graph API usage budget"""
+        return get_usage()
+    
     @app.get("/webhook")
     async def webhook_verify(request: Request):
         """Verify webhook"""
@@ -113,3 +251,57 @@ def setup_routes(app: FastAPI):
     async def webhook_receive(request: Request):
         """Handle webhook"""
         return await handle_webhook(request)
+    
+    @app.get("/webhook/stats")
+    async def webhook_stats():
+        """Get webhook queue depth and lag"""
+        return get_webhook_queue_stats()
+    
+    if LIVE_ENABLED:
+        # Subscriptions are per process; main.check_workers keeps serve mode to one worker
+        @app.get("/live/stats")
+        async def live_stats():
+            """Get live subscriber counts"""
+            return get_live_stats()
+        
+        @app.get("/live/{page_id}")
+        async def live_page(page_id: str):
+            """Push a page's new messages, send results and leads as Server-Sent Events"""
+            if not page_exists(page_id):
+                raise HTTPException(status_code=404, detail="Page not found or not authorized")
+            return sse_response(subscribe([page_topic(page_id)]))
+        
+        @app.get("/live/client/{client_id}")
+        async def live_client(client_id: str):
+            """Push live events of all of a client's pages as Server-Sent Events"""
+            if not client_exists(client_id):
+                raise HTTPException(status_code=404, detail="Client not connected")
+            return sse_response(subscribe([client_topic(client_id)]))
+        
+        @app.websocket("/live/{page_id}/ws")
+        async def live_page_ws(websocket: WebSocket, page_id: str):
+            """Push a page's live events over a WebSocket"""
+            if not page_exists(page_id):
+                await websocket.close(code=1008)
+                return
+            await websocket.accept()
+            await serve_websocket(websocket, [page_topic(page_id)])
+        
+        @app.websocket("/live/client/{client_id}/ws")
+        async def live_client_ws(websocket: WebSocket, client_id: str):
+            """Push live events of all of a client's pages over a WebSocket"""
+            if not client_exists(client_id):
+                await websocket.close(code=1008)
+                return
+            await websocket.accept()
+            await serve_websocket(websocket, [client_topic(client_id)])
+        
+    @app.get("/health/live")
+    async def health_live():
+        """Liveness probe: the process is up"""
+        return {"status": "ok"}
+    
+    @app.get("/health/ready")
+    async def health_ready():
+        """Readiness probe: 503 while starting up or draining"""
+        return JSONResponse(get_health(), status_code=200 if is_ready() else 503)
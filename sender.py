@@ -0,0 +1,263 @@
+import asyncio
+import time
+import uuid
+import httpx
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from fastapi import HTTPException
+from typing import Dict, List, Any, Optional, Tuple
+
+from config import (
+    SEND_RATE_PER_SECOND,
+    SEND_BURST,
+    SEND_MAX_IN_FLIGHT_PER_PAGE,
+    SEND_QUEUE_LIMIT_PER_PAGE,
+    SEND_MAX_ATTEMPTS,
+    SEND_RETRY_BASE_DELAY,
+    SEND_RETRY_MAX_DELAY,
+    SEND_JOB_HISTORY,
+)
+from graph import graph_post, is_send_retryable, backoff_delay
+from store import save_participant_message, format_graph_time
+from metrics import Callback, Counter
+from live import publish_page_event
+from log import get_logger
+
+logger = get_logger("sender")
+
+@dataclass
+class SendJob:
+    job_id: str
+    page_id: str
+    recipient_id: str
+    message_text: str
+    payload: Dict[str, Any]
+    status: str = "queued"  # queued, sending, retrying, sent, failed
+    attempts: int = 0
+    status_code: Optional[int] = None
+    response_body: Any = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    finished_at: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("sent", "failed")
+
+class TokenBucket:
+    """Token bucket pacing sends to rate per second with bursts up to burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Scheduler state, per page and per (page, recipient)
+_buckets: Dict[str, TokenBucket] = {}
+_in_flight: Dict[str, asyncio.Semaphore] = {}
+_pending: Dict[str, int] = {}
+_recipient_tails: Dict[Tuple[str, str], asyncio.Task] = {}
+
+# Jobs by id, oldest first; finished jobs are forgotten past SEND_JOB_HISTORY
+_jobs: "OrderedDict[str, SendJob]" = OrderedDict()
+_tasks: Dict[str, asyncio.Task] = {}
+
+send_results = Counter("send_jobs_total", "Finished send jobs, by final status", ("status",))
+send_attempts = Counter("send_attempts_total", "Graph send attempts, including retries")
+Callback("send_queue_pending", "Unfinished send jobs", lambda: sum(_pending.values()))
+
+def submit_send(page_id: str, recipient_id: str, message_text: str, page_access_token: str) -> SendJob:
+    """Queue a text message for sending and return its job
+    
+    Jobs for the same recipient run strictly in order. Sends are paced
+    per page by a token bucket and retried on throttling and transient
+    errors. Raises a 429 when the page already has
+    SEND_QUEUE_LIMIT_PER_PAGE unfinished jobs.
+    """
+    if _pending.get(page_id, 0) >= SEND_QUEUE_LIMIT_PER_PAGE:
+        raise HTTPException(status_code=429, detail="Too many queued messages for this page")
+    
+    job = SendJob(
+        job_id=uuid.uuid4().hex,
+        page_id=page_id,
+        recipient_id=recipient_id,
+        message_text=message_text,
+        payload={
+            "recipient": {"id": recipient_id},
+            "message": {"text": message_text},
+            "messaging_type": "RESPONSE"
+        }
+    )
+    _remember_job(job)
+    _pending[page_id] = _pending.get(page_id, 0) + 1
+    
+    tail_key = (page_id, recipient_id)
+    previous = _recipient_tails.get(tail_key)
+    task = asyncio.create_task(_run_job(job, previous, page_access_token))
+    _tasks[job.job_id] = task
+    _recipient_tails[tail_key] = task
+
+    def forget(finished: asyncio.Task):
+        _tasks.pop(job.job_id, None)
+        _pending[page_id] -= 1
+        if _recipient_tails.get(tail_key) is finished:
+            del _recipient_tails[tail_key]
+    
+    task.add_done_callback(forget)
+    return job
+
+async def wait_for_job(job: SendJob) -> SendJob:
+    """Wait until a job is sent or has failed"""
+    task = _tasks.get(job.job_id)
+    if task is not None:
+        await asyncio.shield(task)
+    return job
+
+def get_job(job_id: str) -> Optional[SendJob]:
+    """Get a job by id"""
+    return _jobs.get(job_id)
+
+def get_send_stats() -> Dict[str, Any]:
+    """Get queued job counts per page"""
+    return {
+        "pending": sum(_pending.values()),
+        "pending_by_page": {page_id: count for page_id, count in _pending.items() if count},
+        "tracked_jobs": len(_jobs)
+    }
+
+async def drain_sends(timeout: float = 10.0):
+    """Wait up to timeout seconds for unfinished send jobs"""
+    tasks: List[asyncio.Task] = list(_tasks.values())
+    if not tasks:
+        return
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    if pending:
+        logger.warning("Stopping with unsent messages", extra={"unsent": len(pending)})
+
+def _remember_job(job: SendJob):
+    """Track a job, forgetting the oldest finished ones beyond the history size"""
+    _jobs[job.job_id] = job
+    while len(_jobs) > SEND_JOB_HISTORY:
+        oldest = next(iter(_jobs.values()))
+        if not oldest.done:
+            break
+        _jobs.popitem(last=False)
+
+def _get_bucket(page_id: str) -> TokenBucket:
+    """Get the token bucket pacing a page's sends"""
+    bucket = _buckets.get(page_id)
+    if bucket is None:
+        bucket = _buckets[page_id] = TokenBucket(SEND_RATE_PER_SECOND, SEND_BURST)
+    return bucket
+
+def _get_in_flight(page_id: str) -> asyncio.Semaphore:
+    """Get the semaphore capping a page's concurrent sends"""
+    semaphore = _in_flight.get(page_id)
+    if semaphore is None:
+        semaphore = _in_flight[page_id] = asyncio.Semaphore(SEND_MAX_IN_FLIGHT_PER_PAGE)
+    return semaphore
+
+async def _run_job(job: SendJob, previous: Optional[asyncio.Task], page_access_token: str):
+    """Send a job once its recipient's previous job is done, retrying as needed
+
+    Errors that may come after Graph received the message are not retried,
+    so a message is never delivered twice.
+    """
+    if previous is not None:
+        await asyncio.wait([previous])
+    
+    bucket = _get_bucket(job.page_id)
+    in_flight = _get_in_flight(job.page_id)
+    
+    while True:
+        job.attempts += 1
+        job.status = "sending"
+        send_attempts.inc()
+        await bucket.acquire()
+        
+        error: Optional[httpx.HTTPError] = None
+        try:
+            async with in_flight:
+                response = await graph_post(
+                    "/me/messages",
+                    json=job.payload,
+                    params={"access_token": page_access_token},
+                    owner_id=job.page_id
+                )
+        except httpx.HTTPError as e:
+            error = e
+            job.status_code, job.response_body, job.error = None, None, str(e)
+        else:
+            job.status_code = response.status_code
+            try:
+                job.response_body = response.json()
+            except ValueError:
+                job.response_body = response.text
+            job.error = None
+        
+        if job.status_code == 200:
+            job.status = "sent"
+            break
+        
+        if job.attempts >= SEND_MAX_ATTEMPTS or not is_send_retryable(error, job.status_code, job.response_body):
+            job.status = "failed"
+            logger.warning(
+                "Send failed",
+                extra={
+                    "job_id": job.job_id,
+                    "page_id": job.page_id,
+                    "attempts": job.attempts,
+                    "status_code": job.status_code,
+                    "details": job.response_body or job.error
+                }
+            )
+            break
+        
+        job.status = "retrying"
+        logger.info(
+            "Retrying send",
+            extra={"job_id": job.job_id, "attempts": job.attempts, "status_code": job.status_code}
+        )
+        await asyncio.sleep(backoff_delay(job.attempts, SEND_RETRY_BASE_DELAY, SEND_RETRY_MAX_DELAY))
+    
+    job.finished_at = datetime.now().isoformat()
+    send_results.inc(job.status)
+    
+    if job.status == "sent":
+        message_id = job.response_body.get("message_id")
+        logger.info(
+            "Message sent",
+            extra={"job_id": job.job_id, "page_id": job.page_id, "message_id": message_id, "attempts": job.attempts}
+        )
+        save_participant_message(
+            job.page_id,
+            job.recipient_id,
+            message_id,
+            format_graph_time(),
+            {"id": job.page_id},
+            {"data": [{"id": job.recipient_id}]},
+            job.message_text
+        )
+    
+    publish_page_event(job.page_id, "send", {
+        "job_id": job.job_id,
+        "status": job.status,
+        "recipient_id": job.recipient_id,
+        "message": job.message_text,
+        "message_id": job.response_body.get("message_id") if job.status == "sent" else None,
+        "attempts": job.attempts,
+        "error": None if job.status == "sent" else job.response_body or job.error
+    })
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from metrics import Callback
+
+# Upstream calls in progress, keyed by what they fetch
+_inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+# Calls that started an upstream request vs. calls that joined one
+stats = {"leaders": 0, "coalesced": 0}
+
+Callback(
+    "singleflight_calls_total",
+    "Calls that started an upstream request (leader) or joined one (coalesced)",
+    lambda: {("leader",): stats["leaders"], ("coalesced",): stats["coalesced"]},
+    labelnames=("role",),
+    kind="counter"
+)
+Callback("singleflight_inflight", "Upstream calls currently shared", lambda: len(_inflight))
+
+async def singleflight(key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Run factory once for all concurrent callers with the same key
+
+    The first caller starts the call; callers arriving while it is in
+    flight await the same result (or exception). The shared result must
+    be treated as read-only. A cancelled caller does not cancel the call
+    for the others.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        stats["coalesced"] += 1
+        return await asyncio.shield(task)
+    
+    stats["leaders"] += 1
+    task = asyncio.ensure_future(factory())
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
@@ -0,0 +1,337 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from config import STORE_PATH
+
+# One connection per thread; SQLite connections are not shared across threads
+_local = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    page_id TEXT NOT NULL,
+    participant_psid TEXT,
+    participants TEXT NOT NULL,
+    updated_time TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    unread_count INTEGER NOT NULL DEFAULT 0,
+    synced_updated_time TEXT,
+    synced_message_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_page
+    ON conversations (page_id, updated_time);
+CREATE INDEX IF NOT EXISTS idx_conversations_psid
+    ON conversations (page_id, participant_psid);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id TEXT PRIMARY KEY,
+    page_id TEXT NOT NULL,
+    conversation_id TEXT NOT NULL,
+    created_time TEXT,
+    from_data TEXT,
+    to_data TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages (page_id, conversation_id, created_time);
+CREATE INDEX IF NOT EXISTS idx_messages_page
+    ON messages (page_id, created_time);
+
+CREATE TABLE IF NOT EXISTS backfills (
+    page_id TEXT PRIMARY KEY,
+    backfilled_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS leads (
+    lead_id TEXT PRIMARY KEY,
+    client_id TEXT,
+    account_id TEXT,
+    form_id TEXT NOT NULL,
+    form_name TEXT,
+    created_time TEXT,
+    field_data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_client
+    ON leads (client_id, created_time);
+
+-- Newest created_time synced per leadgen form
+CREATE TABLE IF NOT EXISTS lead_watermarks (
+    form_id TEXT PRIMARY KEY,
+    created_time TEXT NOT NULL,
+    synced_at TEXT NOT NULL
+);
+"""
+
+# Columns added to existing tables after their creation, as (table, column, definition)
+MIGRATIONS = [
+    ("conversations", "synced_updated_time", "TEXT"),
+    ("conversations", "synced_message_count", "INTEGER"),
+]
+
+def _migrate(conn: sqlite3.Connection):
+    """Add columns missing from stores created by older versions"""
+    for table, column, definition in MIGRATIONS:
+        columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column in columns:
+            continue
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        except sqlite3.OperationalError as e:
+            # Another worker may have added it first
+            if "duplicate column" not in str(e):
+                raise
+
+def get_connection() -> sqlite3.Connection:
+    """Get this thread's connection to the local store"""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(STORE_PATH)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+def format_graph_time(timestamp_ms: Optional[int] = None) -> str:
+    """Format a millisecond timestamp, or the current time, like Graph's created_time"""
+    if timestamp_ms is None:
+        moment = datetime.now(timezone.utc)
+    else:
+        moment = datetime.fromtimestamp(timestamp_ms / 1000, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+def placeholder_conversation_id(page_id: str, psid: str) -> str:
+    """Conversation id used for a participant seen before the page's backfill"""
+    return f"local_{page_id}_{psid}"
+
+def _participant_psid(page_id: str, participants: List[Dict[str, Any]]) -> Optional[str]:
+    """Get the first participant that is not the page itself"""
+    for participant in participants:
+        if participant.get("id") != page_id:
+            return participant.get("id")
+    return None
+
+def save_conversations(page_id: str, conversations: List[Dict[str, Any]]):
+    """Store Graph conversations, adopting messages stored under placeholders"""
+    conn = get_connection()
+    with conn:
+        for conversation in conversations:
+            participants = conversation.get("participants", {}).get("data", [])
+            psid = _participant_psid(page_id, participants)
+            conn.execute(
+                "INSERT INTO conversations (conversation_id, page_id, participant_psid, participants, "
+                "updated_time, message_count, unread_count) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (conversation_id) DO UPDATE SET participants = excluded.participants, "
+                "participant_psid = excluded.participant_psid, updated_time = excluded.updated_time, "
+                "message_count = excluded.message_count, unread_count = excluded.unread_count",
+                (
+                    conversation["id"], page_id, psid, json.dumps(participants),
+                    conversation.get("updated_time"), conversation.get("message_count", 0),
+                    conversation.get("unread_count", 0)
+                )
+            )
+            if psid:
+                placeholder_id = placeholder_conversation_id(page_id, psid)
+                conn.execute(
+                    "UPDATE messages SET conversation_id = ? WHERE conversation_id = ?",
+                    (conversation["id"], placeholder_id)
+                )
+                conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (placeholder_id,))
+
+def save_messages(page_id: str, conversation_id: str, messages: List[Dict[str, Any]]):
+    """Store Graph messages of a conversation"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO messages (message_id, page_id, conversation_id, created_time, "
+            "from_data, to_data, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    msg.get("id"), page_id, conversation_id, msg.get("created_time"),
+                    json.dumps(msg.get("from")), json.dumps(msg.get("to")), msg.get("message")
+                )
+                for msg in messages
+            ]
+        )
+
+def save_participant_message(
+    page_id: str,
+    psid: str,
+    message_id: str,
+    created_time: str,
+    from_data: Dict[str, Any],
+    to_data: Dict[str, Any],
+    message: Optional[str]
+) -> bool:
+    """Store a message exchanged with a participant, as seen by a webhook or a send
+    
+    The message is filed under the participant's conversation, or under a
+    placeholder conversation until the page's backfill brings in the real
+    one. Returns False when the message was already stored.
+    """
+    conn = get_connection()
+    with conn:
+        row = conn.execute(
+            "SELECT conversation_id FROM conversations WHERE page_id = ? AND participant_psid = ?",
+            (page_id, psid)
+        ).fetchone()
+        if row:
+            conversation_id = row["conversation_id"]
+        else:
+            conversation_id = placeholder_conversation_id(page_id, psid)
+            conn.execute(
+                "INSERT INTO conversations (conversation_id, page_id, participant_psid, participants, "
+                "updated_time) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, page_id, psid, json.dumps([{"id": psid}]), created_time)
+            )
+        
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO messages (message_id, page_id, conversation_id, created_time, "
+            "from_data, to_data, message) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                message_id, page_id, conversation_id, created_time,
+                json.dumps(from_data), json.dumps(to_data), message
+            )
+        ).rowcount
+        if inserted:
+            conn.execute(
+                "UPDATE conversations SET message_count = message_count + 1, "
+                "updated_time = MAX(COALESCE(updated_time, ''), ?) WHERE conversation_id = ?",
+                (created_time, conversation_id)
+            )
+    return bool(inserted)
+
+def get_sync_state(page_id: str) -> Dict[str, Tuple[Optional[str], Optional[int]]]:
+    """Get each conversation's updated_time and message_count as of its last message fetch"""
+    rows = get_connection().execute(
+        "SELECT conversation_id, synced_updated_time, synced_message_count FROM conversations WHERE page_id = ?",
+        (page_id,)
+    ).fetchall()
+    return {row["conversation_id"]: (row["synced_updated_time"], row["synced_message_count"]) for row in rows}
+
+def mark_conversations_synced(conversations: List[Dict[str, Any]]):
+    """Record the Graph updated_time and message_count of conversations whose messages were fetched"""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE conversations SET synced_updated_time = ?, synced_message_count = ? WHERE conversation_id = ?",
+            [
+                (conversation.get("updated_time"), conversation.get("message_count", 0), conversation["id"])
+                for conversation in conversations
+            ]
+        )
+
+def mark_backfilled(page_id: str):
+    """Record that a page's history has been loaded from Graph"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO backfills (page_id, backfilled_at) VALUES (?, ?)",
+            (page_id, datetime.now().isoformat())
+        )
+
+def is_backfilled(page_id: str) -> bool:
+    """Check whether a page's history has been loaded from Graph"""
+    row = get_connection().execute(
+        "SELECT 1 FROM backfills WHERE page_id = ?", (page_id,)
+    ).fetchone()
+    return row is not None
+
+def _conversation_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a conversations row to Graph's shape"""
+    return {
+        "id": row["conversation_id"],
+        "participants": {"data": json.loads(row["participants"])},
+        "updated_time": row["updated_time"],
+        "message_count": row["message_count"],
+        "unread_count": row["unread_count"]
+    }
+
+def load_conversations(page_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Load a page's conversations in Graph's shape, most recently updated first"""
+    rows = get_connection().execute(
+        "SELECT * FROM conversations WHERE page_id = ? ORDER BY updated_time DESC LIMIT ?",
+        (page_id, limit if limit is not None else -1)
+    ).fetchall()
+    return [_conversation_from_row(row) for row in rows]
+
+def load_unsynced_conversations(page_id: str) -> List[Dict[str, Any]]:
+    """Load a page's Graph conversations whose messages have never been fetched
+    
+    Placeholder conversations are left out; they have no Graph id to fetch.
+    """
+    rows = get_connection().execute(
+        "SELECT * FROM conversations WHERE page_id = ? AND synced_message_count IS NULL "
+        "AND conversation_id NOT LIKE ? ORDER BY updated_time DESC",
+        (page_id, placeholder_conversation_id(page_id, "%"))
+    ).fetchall()
+    return [_conversation_from_row(row) for row in rows]
+
+def _message_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Convert a messages row to Graph's shape"""
+    return {
+        "id": row["message_id"],
+        "created_time": row["created_time"],
+        "from": json.loads(row["from_data"]),
+        "to": json.loads(row["to_data"]),
+        "message": row["message"]
+    }
+
+def load_messages(page_id: str, conversation_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Load a conversation's latest limit messages (all without one) in Graph's shape, newest first"""
+    rows = get_connection().execute(
+        "SELECT * FROM messages WHERE page_id = ? AND conversation_id = ? "
+        "ORDER BY created_time DESC LIMIT ?",
+        (page_id, conversation_id, limit if limit is not None else -1)
+    ).fetchall()
+    return [_message_from_row(row) for row in rows]
+
+def iter_messages(page_id: str, conversation_id: str) -> Iterator[Dict[str, Any]]:
+    """Iterate a conversation's messages newest first, reading rows only as they are consumed"""
+    cursor = get_connection().execute(
+        "SELECT * FROM messages WHERE page_id = ? AND conversation_id = ? ORDER BY created_time DESC",
+        (page_id, conversation_id)
+    )
+    for row in cursor:
+        yield _message_from_row(row)
+
+def save_leads(client_id: Optional[str], account_id: Optional[str], leads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Store formatted leads, skipping lead ids already stored; returns the new ones"""
+    conn = get_connection()
+    new_leads = []
+    with conn:
+        for lead in leads:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO leads (lead_id, client_id, account_id, form_id, form_name, "
+                "created_time, field_data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    lead["lead_id"], client_id, account_id, lead["form_id"], lead.get("form_name"),
+                    lead.get("created_time"), json.dumps(lead.get("field_data", []))
+                )
+            ).rowcount
+            if inserted:
+                new_leads.append(lead)
+    return new_leads
+
+def get_lead_watermark(form_id: str) -> Optional[str]:
+    """Get the newest created_time synced for a leadgen form"""
+    row = get_connection().execute(
+        "SELECT created_time FROM lead_watermarks WHERE form_id = ?", (form_id,)
+    ).fetchone()
+    return row["created_time"] if row else None
+
+def set_lead_watermark(form_id: str, created_time: str):
+    """Advance a leadgen form's watermark; it never moves backwards"""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT INTO lead_watermarks (form_id, created_time, synced_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (form_id) DO UPDATE SET created_time = MAX(created_time, excluded.created_time), "
+            "synced_at = excluded.synced_at",
+            (form_id, created_time, datetime.now().isoformat())
+        )
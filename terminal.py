@@ -1,8 +1,35 @@
+import json
+import time
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
-def terminal_interface():
+from config import HOST, PORT, SERVER_READY_TIMEOUT, TERMINAL_REQUEST_TIMEOUT
+
+# Base URL of the CRM server this terminal talks to
+server_url = f"http://{HOST}:{PORT}"
+
+def wait_for_server(timeout: float = SERVER_READY_TIMEOUT) -> bool:
+    """Poll the server's readiness endpoint until it answers 200 or timeout passes"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{server_url}/health/ready", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+def terminal_interface(url: Optional[str] = None):
     """Interactive terminal interface for sending messages"""
+    global server_url
+    if url:
+        server_url = url.rstrip("/")
+    
+    if not wait_for_server():
+        print(f"❌ Server at {server_url} is not ready")
+        return
+    
     print("\n" + "="*60)
     print("🔥 FACEBOOK MESSENGER TERMINAL INTERFACE")
     print("="*60)
@@ -13,9 +40,10 @@ def terminal_interface():
             print("1. List Pages")
             print("2. List Conversations")
             print("3. Send Message")
-            print("4. Exit")
+            print("4. Watch Live Events")
+            print("5. Exit")
             
-            choice = input("\n👉 Enter your choice (1-4): ").strip()
+            choice = input("\n👉 Enter your choice (1-5): ").strip()
             
             if choice == "1":
                 list_pages()
@@ -24,10 +52,12 @@ def terminal_interface():
             elif choice == "3":
                 send_message_terminal()
             elif choice == "4":
+                watch_live()
+            elif choice == "5":
                 print("👋 Goodbye!")
                 break
             else:
-                print("❌ Invalid choice. Please enter 1-4.")
+                print("❌ Invalid choice. Please enter 1-5.")
                 
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
@@ -37,7 +67,7 @@ def terminal_interface():
 
 def list_pages():
     """List available pages"""
-    response = requests.get("http://localhost:8000/terminal/pages")
+    response = requests.get(f"{server_url}/terminal/pages", timeout=TERMINAL_REQUEST_TIMEOUT)
     if response.status_code == 200:
         data = response.json()
         if "pages" in data:
@@ -53,7 +83,7 @@ def list_conversations():
     """List conversations for a page"""
     page_id = input("📄 Enter Page ID: ").strip()
     if page_id:
-        response = requests.get(f"http://localhost:8000/terminal/conversations/{page_id}")
+        response = requests.get(f"{server_url}/terminal/conversations/{page_id}", timeout=TERMINAL_REQUEST_TIMEOUT)
         if response.status_code == 200:
             data = response.json()
             if "conversations" in data:
@@ -78,9 +108,10 @@ def send_message_terminal():
         }
         
         response = requests.post(
-            f"http://localhost:8000/messages/{page_id}/send",
+            f"{server_url}/messages/{page_id}/send",
             json=payload,
-            headers={"Content-Type": "application/json"}
+            headers={"Content-Type": "application/json"},
+            timeout=TERMINAL_REQUEST_TIMEOUT
         )
         
         if response.status_code == 200:
@@ -95,3 +126,36 @@ def send_message_terminal():
             print(f"❌ HTTP Error {response.status_code}: {response.text}")
     else:
         print("❌ All fields are required!")
+
+def watch_live():
+    """Print a page's live events as they arrive, until Ctrl+C"""
+    page_id = input("📄 Enter Page ID: ").strip()
+    if not page_id:
+        print("❌ Page ID is required!")
+        return
+    
+    print("👀 Watching live events (Ctrl+C to stop)...")
+    try:
+        with requests.get(f"{server_url}/live/{page_id}", stream=True, timeout=(5, None)) as response:
+            if response.status_code != 200:
+                print(f"❌ HTTP Error {response.status_code}: {response.text}")
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    print_live_event(json.loads(line[len("data: "):]))
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopped watching")
+
+def print_live_event(event: Dict[str, Any]):
+    """Print one live event"""
+    data = event.get("data", {})
+    if event["type"] == "message":
+        arrow = "📤" if data.get("is_echo") else "📥"
+        print(f"{arrow} {data['from']['id']}: {data.get('message')}")
+    elif event["type"] == "send":
+        status = "✅" if data["status"] == "sent" else "❌"
+        print(f"{status} Sent to {data['recipient_id']}: {data['message']} ({data['status']})")
+    elif event["type"] == "lead":
+        print(f"🎯 New lead {data['lead_id']} from form {data['form_id']}")
+    elif event["type"] == "dropped":
+        print(f"⚠️ {data['reason']}")
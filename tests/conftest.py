@@ -0,0 +1,72 @@
+import os
+import sys
+import threading
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakegraph
+import graph
+import models
+import sender
+import singleflight
+import store
+from cache import graph_cache
+from breaker import graph_breaker
+from main import app
+
+CLIENT_ID = "cl"
+PAGE_ID = "100000"
+
+@pytest.fixture
+def fake_graph(monkeypatch):
+    """Serve Graph calls from fakegraph's app in-process, with no latency or faults"""
+    monkeypatch.setattr(fakegraph, "settings", {
+        **fakegraph.settings,
+        "pages": 2,
+        "conversations": 4,
+        "messages": 3,
+        "ad_accounts": 1,
+        "forms": 2,
+        "leads": 3,
+        "latency_ms": 0.0,
+    })
+    monkeypatch.setattr(fakegraph, "fake_stats", {key: 0 for key in fakegraph.fake_stats})
+    return fakegraph
+
+@pytest.fixture
+def client(fake_graph, tmp_path, monkeypatch):
+    """A TestClient for the app with a fresh store and token store, talking to the fake Graph"""
+    monkeypatch.setattr(store, "STORE_PATH", str(tmp_path / "store.db"))
+    monkeypatch.setattr(store, "_local", threading.local())
+    monkeypatch.setattr(models, "token_store", models.MemoryTokenStore())
+    graph_cache.clear()
+    graph_breaker.record_success()
+    # Module state holding asyncio objects bound to an earlier test's event loop
+    for state in (
+        graph._token_semaphores,
+        singleflight._inflight,
+        sender._buckets,
+        sender._in_flight,
+        sender._pending,
+        sender._recipient_tails,
+        sender._jobs,
+        sender._tasks,
+    ):
+        state.clear()
+    monkeypatch.setattr(graph, "_client", httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=fake_graph.app), base_url="http://fakegraph/v18.0"
+    ))
+    
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def connected(client):
+    """The client after CLIENT_ID has connected its pages through the OAuth callback"""
+    response = client.get("/auth/facebook/callback", params={"code": "test", "state": f"{CLIENT_ID}_1"})
+    assert response.status_code == 200
+    assert response.json()["client_id"] == CLIENT_ID
+    return client
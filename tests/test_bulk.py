@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from conftest import PAGE_ID
+
+RECIPIENT = f"{PAGE_ID}000001"
+
+def bulk(client, body):
+    if isinstance(body, bytes):
+        return client.post(f"/messages/{PAGE_ID}/send/bulk", content=body)
+    return client.post(f"/messages/{PAGE_ID}/send/bulk", json=body)
+
+@pytest.mark.parametrize("body, detail", [
+    ({"messages": [{"recipient_id": RECIPIENT, "message": "Hi"}, "x"]}, "messages[1] must be an object"),
+    ({"template": "Hi $name", "recipients": [RECIPIENT, {"recipient_id": RECIPIENT, "variables": ["x"]}]}, "recipients[1].variables must be an object"),
+    ({"template": 5, "recipients": [RECIPIENT]}, "template must be a string"),
+    (["x"], "Request body must be an object"),
+    (b"{not json", "Request body must be JSON"),
+])
+def test_malformed_bulk_items_are_rejected(connected, body, detail):
+    response = bulk(connected, body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
+
+def test_bulk_send_from_template(connected):
+    response = bulk(connected, {"template": "Hi $name", "recipients": [{"recipient_id": RECIPIENT, "variables": {"name": "Ann"}}]})
+    assert response.status_code == 200
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert records[-1]["summary"]["sent"] == 1
+
+@pytest.mark.parametrize("content, detail", [
+    (b"{not json", "Request body must be JSON"),
+    (b'["x"]', "Request body must be an object"),
+])
+def test_malformed_single_send_bodies_are_rejected(connected, content, detail):
+    response = connected.post(f"/messages/{PAGE_ID}/send", content=content)
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
@@ -0,0 +1,8 @@
+from conftest import PAGE_ID
+
+def test_batch_calls_reach_the_fake_graph(connected, fake_graph):
+    body = connected.get(f"/messages/{PAGE_ID}", params={"batch": True}).json()
+    
+    assert body["failed_conversations"] == []
+    assert body["total_messages"] == 4 * 3
+    assert fake_graph.fake_stats["batch_calls"] == 1
@@ -0,0 +1,131 @@
+import asyncio
+
+import httpx
+import pytest
+
+import graph
+from breaker import CircuitBreaker, graph_breaker
+
+def test_breaker_opens_after_consecutive_failures_and_trial_decides():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    
+    # reset_timeout has passed: a single trial call goes through
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+def test_open_breaker_refuses_calls_until_the_reset_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+    assert breaker.retry_after() > 0
+
+@pytest.fixture
+def graph_transport(monkeypatch):
+    """Answer Graph calls with a handler; returns a setter for it"""
+    graph_breaker.record_success()
+    monkeypatch.setattr(graph_breaker, "reset_timeout", 60)
+    monkeypatch.setattr(graph, "_client", None)
+
+    def use(handler):
+        monkeypatch.setattr(graph, "_client", httpx.AsyncClient(
+            transport=httpx.MockTransport(handler), base_url="http://fakegraph/v18.0"
+        ))
+    
+    yield use
+    graph_breaker.record_success()
+
+def call_graph(times: int):
+    """Make GET calls in turn, returning each response or exception"""
+    async def calls():
+        results = []
+        for index in range(times):
+            try:
+                results.append(await graph.graph_get(f"/{index}"))
+            except httpx.HTTPError as e:
+                results.append(e)
+        return results
+    
+    return asyncio.run(calls())
+
+def refuse(request):
+    raise httpx.ConnectError("refused")
+
+def test_transport_errors_open_the_circuit(graph_transport):
+    graph_transport(refuse)
+    
+    results = call_graph(graph_breaker.failure_threshold + 1)
+    assert graph_breaker.state == "open"
+    assert all(isinstance(result, httpx.ConnectError) for result in results[:-1])
+    assert isinstance(results[-1], graph.GraphUnavailable)
+
+def test_bare_5xx_responses_open_the_circuit(graph_transport):
+    graph_transport(lambda request: httpx.Response(502, text="Bad Gateway"))
+    
+    call_graph(graph_breaker.failure_threshold)
+    assert graph_breaker.state == "open"
+
+def test_per_object_graph_errors_leave_the_circuit_closed(graph_transport):
+    graph_transport(lambda request: httpx.Response(500, json={
+        "error": {"message": "An unknown error has occurred.", "code": 1, "is_transient": False}
+    }))
+    
+    results = call_graph(graph_breaker.failure_threshold * 2)
+    assert graph_breaker.state == "closed"
+    assert all(result.status_code == 500 for result in results)
+
+def test_half_open_trial_closes_or_reopens_the_circuit(graph_transport, monkeypatch):
+    graph_transport(refuse)
+    call_graph(graph_breaker.failure_threshold)
+    assert graph_breaker.state == "open"
+    
+    monkeypatch.setattr(graph_breaker, "reset_timeout", 0)
+    call_graph(1)
+    assert graph_breaker.state == "open"
+    
+    graph_transport(lambda request: httpx.Response(200, json={"id": "1"}))
+    assert call_graph(1)[0].status_code == 200
+    assert graph_breaker.state == "closed"
+
+def test_slow_gets_are_hedged(graph_transport, monkeypatch):
+    calls = []
+
+    async def slow_first(request):
+        calls.append(request.url.path)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"call": len(calls)})
+    
+    graph_transport(slow_first)
+    monkeypatch.setattr(graph, "GRAPH_HEDGE_DELAY", 0.01)
+    
+    response = call_graph(1)[0]
+    assert response.json() == {"call": 2}
+    assert len(calls) == 2
+
+def test_hedging_leaves_posts_alone(graph_transport, monkeypatch):
+    calls = []
+
+    async def slow(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={})
+    
+    graph_transport(slow)
+    monkeypatch.setattr(graph, "GRAPH_HEDGE_DELAY", 0.01)
+    
+    asyncio.run(graph.graph_post("/me/messages", json={}))
+    assert len(calls) == 1
@@ -0,0 +1,40 @@
+import json
+import time
+import pytest
+
+import messaging
+from conftest import CLIENT_ID
+
+def inbox(client, **params):
+    response = client.get(f"/inbox/{CLIENT_ID}", params=params)
+    return response, [json.loads(line) for line in response.text.splitlines()]
+
+@pytest.mark.parametrize("limit", [-1, 0, 1000])
+def test_inbox_limit_out_of_range_is_rejected_before_streaming(connected, limit):
+    response, _ = inbox(connected, limit=limit)
+    assert response.status_code == 400
+
+def test_inbox_merges_pages_newest_first(connected):
+    response, records = inbox(connected, limit=5)
+    assert response.status_code == 200
+    assert len(records) == 5
+    times = [record["created_time"] for record in records]
+    assert times == sorted(times, reverse=True)
+
+def test_slow_pages_are_reported_once_the_deadline_passes(connected, fake_graph, monkeypatch):
+    monkeypatch.setattr(messaging, "GRAPH_REQUEST_DEADLINE", 0.2)
+    fake_graph.settings.update(latency_ms=2000.0, latency_sigma=0.0)
+    
+    started = time.monotonic()
+    response, records = inbox(connected, limit=5)
+    assert time.monotonic() - started < 1.5
+    assert response.status_code == 200
+    assert {record["page_id"] for record in records if "error" in record} == {"100000", "100001"}
+
+def test_inbox_fetches_messages_of_conversations_loaded_without_them(connected):
+    for page_id in ("100000", "100001"):
+        connected.get(f"/conversations/{page_id}")
+    
+    response, records = inbox(connected, limit=2 * 4 * 3)
+    assert response.status_code == 200
+    assert len(records) == 2 * 4 * 3
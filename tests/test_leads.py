@@ -0,0 +1,56 @@
+import asyncio
+import time
+import pytest
+
+import leads
+import usage
+from deadline import graph_deadline
+from graph import GraphDeadlineExceeded
+from conftest import CLIENT_ID
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_leads_of_every_form(connected, batch):
+    body = connected.get(f"/leads/{CLIENT_ID}", params={"batch": batch}).json()
+    assert body["total_leads"] == 2 * 3
+    assert body["failed_forms"] == []
+    assert body["partial"] is False
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_failed_forms_are_reported(connected, fake_graph, monkeypatch, batch):
+    resolve = fake_graph.resolve
+
+    def failing_resolve(method, path, params, body):
+        if path.endswith("/leads"):
+            return fake_graph.graph_error(500, "Unknown error", 2, True)
+        return resolve(method, path, params, body)
+    
+    monkeypatch.setattr(fake_graph, "resolve", failing_resolve)
+    body = connected.get(f"/leads/{CLIENT_ID}", params={"batch": batch}).json()
+    assert body["total_leads"] == 0
+    assert body["partial"] is True
+    assert sorted(failure["form_id"] for failure in body["failed_forms"]) == ["400000", "400001"]
+
+def test_forms_past_the_deadline_are_reported(connected, monkeypatch):
+    graph_get = leads.graph_get
+
+    async def deadline_on_leads(path, **kwargs):
+        if path.endswith("/leads"):
+            raise GraphDeadlineExceeded("Deadline passed before GET /{id}/leads")
+        return await graph_get(path, **kwargs)
+    
+    monkeypatch.setattr(leads, "graph_get", deadline_on_leads)
+    body = connected.get(f"/leads/{CLIENT_ID}").json()
+    assert body["partial"] is True
+    assert [failure["status_code"] for failure in body["failed_forms"]] == [None, None]
+    assert "Deadline" in body["failed_forms"][0]["details"]
+
+def test_throttle_pause_ends_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(usage, "throttle_delay", lambda owner_id=None: 30.0)
+
+    async def throttled():
+        with graph_deadline(0.1):
+            await usage.throttle("act_300000")
+    
+    started = time.monotonic()
+    asyncio.run(throttled())
+    assert time.monotonic() - started < 1.0
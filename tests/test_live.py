@@ -0,0 +1,66 @@
+import asyncio
+import signal
+
+import pytest
+from fastapi import HTTPException
+
+import health
+import live
+import main
+
+@pytest.fixture
+def ready():
+    """A ready worker, restored to ready afterwards"""
+    health.mark_ready()
+    yield
+    health.mark_ready()
+
+def test_draining_ends_live_streams_and_refuses_new_subscribers(ready):
+    async def scenario():
+        subscription = live.subscribe([live.page_topic("1")])
+        stream = live.events(subscription)
+        live.publish([live.page_topic("1")], {"type": "message"})
+        assert (await stream.__anext__())["type"] == "message"
+        
+        health.mark_draining()
+        live.close_subscriptions()
+        assert (await stream.__anext__())["type"] == "shutdown"
+        with pytest.raises(StopAsyncIteration):
+            await stream.__anext__()
+        assert live.get_live_stats()["subscribers"] == 0
+        
+        with pytest.raises(HTTPException) as refused:
+            live.subscribe([live.page_topic("1")])
+        assert refused.value.status_code == 503
+    
+    asyncio.run(scenario())
+
+def test_exit_signal_drains_before_reaching_uvicorn(ready, monkeypatch):
+    monkeypatch.setattr(main, "SERVER_DRAIN_DELAY", 0.05)
+    received = []
+    original_handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+
+    async def scenario():
+        for sig in original_handlers:
+            signal.signal(sig, lambda signum, frame: received.append(signum))
+        main.drain_on_exit()
+        subscription = live.subscribe([live.page_topic("1")])
+        
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        assert health.get_health()["status"] == "draining"
+        assert received == []
+        
+        await asyncio.sleep(0.01)
+        assert subscription.closed
+        await asyncio.sleep(0.1)
+        assert received == [signal.SIGTERM]
+        
+        # A second signal is not delayed
+        signal.getsignal(signal.SIGINT)(signal.SIGINT, None)
+        assert received == [signal.SIGTERM, signal.SIGINT]
+    
+    try:
+        asyncio.run(scenario())
+    finally:
+        for sig, handler in original_handlers.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,22 @@
+import pytest
+
+import main
+
+def test_several_workers_are_refused_while_live_is_enabled(monkeypatch):
+    monkeypatch.setattr(main, "LIVE_ENABLED", True)
+    with pytest.raises(ValueError):
+        main.check_workers(2)
+    main.check_workers(1)
+
+def test_several_workers_are_allowed_without_live(monkeypatch):
+    monkeypatch.setattr(main, "LIVE_ENABLED", False)
+    main.check_workers(4)
+    with pytest.raises(ValueError):
+        main.check_workers(0)
+
+def test_serve_rejects_several_workers(monkeypatch, capsys):
+    monkeypatch.setattr(main, "LIVE_ENABLED", True)
+    monkeypatch.setattr("sys.argv", ["main.py", "serve", "--workers", "2"])
+    with pytest.raises(SystemExit):
+        main.parse_args()
+    assert "single worker" in capsys.readouterr().err
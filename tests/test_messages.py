@@ -0,0 +1,109 @@
+from conftest import CLIENT_ID, PAGE_ID
+
+def test_message_limit_above_default_returns_every_stored_message(connected, fake_graph):
+    fake_graph.settings["messages"] = 80
+    
+    body = connected.get(f"/messages/{PAGE_ID}", params={"message_limit": 100}).json()
+    assert body["total_messages"] == 4 * 80
+    
+    compact = connected.get(f"/messages/{PAGE_ID}", params={"message_limit": 100, "compact": True}).json()
+    assert compact["total_messages"] == 4 * 80
+
+def test_message_limit_caps_stored_messages_per_conversation(connected, fake_graph):
+    fake_graph.settings["messages"] = 10
+    connected.get(f"/messages/{PAGE_ID}")
+    
+    body = connected.get(f"/messages/{PAGE_ID}", params={"message_limit": 2}).json()
+    assert body["source"] == "store"
+    assert body["total_messages"] == 4 * 2
+
+def test_refresh_fetches_from_graph_not_the_response_cache(connected, fake_graph):
+    connected.get(f"/messages/{PAGE_ID}")
+    requests_before = fake_graph.fake_stats["requests"]
+    fake_graph.settings["messages"] = 5
+    
+    body = connected.get(f"/messages/{PAGE_ID}", params={"refresh": True}).json()
+    assert fake_graph.fake_stats["requests"] > requests_before
+    assert body["total_messages"] == 4 * 5
+    
+    conversations = connected.get(f"/conversations/{PAGE_ID}").json()["conversations"]
+    assert {conversation["message_count"] for conversation in conversations} == {5}
+
+def fail_message_fetches(monkeypatch, fake_graph):
+    """Answer every /{conversation}/messages call of the fake Graph with a 500"""
+    resolve = fake_graph.resolve
+
+    def failing_resolve(method, path, params, body):
+        if path.endswith("/messages") and path.strip("/").startswith("t_"):
+            return fake_graph.graph_error(500, "Unknown error", 2, True)
+        return resolve(method, path, params, body)
+    
+    monkeypatch.setattr(fake_graph, "resolve", failing_resolve)
+    return resolve
+
+def test_failed_conversations_are_fetched_again_on_the_next_read(connected, fake_graph, monkeypatch):
+    resolve = fail_message_fetches(monkeypatch, fake_graph)
+    first = connected.get(f"/messages/{PAGE_ID}").json()
+    assert len(first["failed_conversations"]) == 4
+    assert first["total_messages"] == 0
+    
+    monkeypatch.setattr(fake_graph, "resolve", resolve)
+    requests_before = fake_graph.fake_stats["requests"]
+    second = connected.get(f"/messages/{PAGE_ID}").json()
+    assert fake_graph.fake_stats["requests"] - requests_before == 4
+    assert second["failed_conversations"] == []
+    assert second["total_messages"] == 4 * 3
+    
+    requests_before = fake_graph.fake_stats["requests"]
+    assert connected.get(f"/messages/{PAGE_ID}").json()["total_messages"] == 4 * 3
+    assert fake_graph.fake_stats["requests"] == requests_before
+
+def test_a_failing_conversation_is_the_only_one_fetched_again(connected, fake_graph, monkeypatch):
+    resolve = fake_graph.resolve
+    broken = fake_graph.conversation(PAGE_ID, 0)["id"]
+
+    def failing_resolve(method, path, params, body):
+        if path.strip("/") == f"{broken}/messages":
+            return fake_graph.graph_error(403, "Permissions error", 200)
+        return resolve(method, path, params, body)
+    
+    monkeypatch.setattr(fake_graph, "resolve", failing_resolve)
+    connected.get(f"/messages/{PAGE_ID}")
+    
+    for _ in range(2):
+        requests_before = fake_graph.fake_stats["requests"]
+        body = connected.get(f"/messages/{PAGE_ID}").json()
+        assert fake_graph.fake_stats["requests"] - requests_before == 1
+        assert [failed["conversation_id"] for failed in body["failed_conversations"]] == [broken]
+        assert body["total_messages"] == 3 * 3
+
+def test_conversations_are_loaded_with_one_graph_call(connected, fake_graph):
+    requests_before = fake_graph.fake_stats["requests"]
+    assert connected.get(f"/conversations/{PAGE_ID}").json()["total_conversations"] == 4
+    assert fake_graph.fake_stats["requests"] - requests_before == 1
+    
+    # Their messages are fetched by the first message read
+    assert connected.get(f"/messages/{PAGE_ID}").json()["total_messages"] == 4 * 3
+    assert fake_graph.fake_stats["requests"] - requests_before == 1 + 4
+
+def test_refresh_refetches_every_conversation_unless_delta_is_set(connected, fake_graph):
+    connected.get(f"/messages/{PAGE_ID}")
+    
+    requests_before = fake_graph.fake_stats["requests"]
+    connected.get(f"/messages/{PAGE_ID}", params={"refresh": True})
+    assert fake_graph.fake_stats["requests"] - requests_before == 1 + 4
+    
+    requests_before = fake_graph.fake_stats["requests"]
+    body = connected.get(f"/messages/{PAGE_ID}", params={"refresh": True, "delta": True}).json()
+    assert fake_graph.fake_stats["requests"] - requests_before == 1
+    assert body["total_messages"] == 4 * 3
+
+def test_failing_conversations_do_not_open_the_circuit_for_other_calls(connected, fake_graph, monkeypatch):
+    fake_graph.settings["conversations"] = 10
+    fail_message_fetches(monkeypatch, fake_graph)
+    
+    body = connected.get(f"/messages/{PAGE_ID}").json()
+    assert len(body["failed_conversations"]) == 10
+    
+    assert connected.get(f"/leads/{CLIENT_ID}").status_code == 200
+    assert connected.get("/debug/100001").status_code == 200
@@ -0,0 +1,52 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from metrics import RequestMetricsMiddleware, http_requests, http_errors, http_latency
+
+def metrics_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestMetricsMiddleware)
+
+    @app.get("/metrics-test/ok/{item_id}")
+    async def ok(item_id: str):
+        return {"id": item_id}
+
+    @app.get("/metrics-test/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    @app.get("/metrics-test/stream")
+    async def stream():
+        async def body():
+            yield b"first\n"
+            await asyncio.sleep(0.2)
+            yield b"second\n"
+        return StreamingResponse(body())
+    
+    return app
+
+def test_requests_are_counted_by_route_template():
+    client = TestClient(metrics_app())
+    client.get("/metrics-test/ok/1")
+    client.get("/metrics-test/ok/2")
+    
+    assert http_requests._values[("GET", "/metrics-test/ok/{item_id}", 200)] == 2
+
+def test_unhandled_errors_count_as_500():
+    client = TestClient(metrics_app(), raise_server_exceptions=False)
+    assert client.get("/metrics-test/boom").status_code == 500
+    
+    assert http_requests._values[("GET", "/metrics-test/boom", 500)] >= 1
+    assert http_errors._values[("GET", "/metrics-test/boom")] >= 1
+
+def test_latency_stops_at_the_response_headers():
+    client = TestClient(metrics_app())
+    response = client.get("/metrics-test/stream")
+    assert response.text == "first\nsecond\n"
+    
+    _, total, count = http_latency._values[("GET", "/metrics-test/stream")]
+    assert count == 1
+    assert total < 0.2
@@ -0,0 +1,22 @@
+import pytest
+
+from models import TokenStore, MemoryTokenStore
+
+def test_token_store_subclasses_must_implement_every_method():
+    class PartialTokenStore(TokenStore):
+        def put(self, kind, key, data):
+            pass
+    
+    with pytest.raises(TypeError):
+        PartialTokenStore()
+    with pytest.raises(TypeError):
+        TokenStore()
+
+def test_memory_token_store_round_trip():
+    store = MemoryTokenStore()
+    store.put("page", "1", {"access_token": "a"})
+    store.put("client", "1", {"access_token": "b"})
+    
+    assert store.get("page", "1") == {"access_token": "a"}
+    assert store.get("page", "2") is None
+    assert store.items("page") == [("1", {"access_token": "a"})]
@@ -0,0 +1,55 @@
+import gzip
+import json
+
+from starlette.requests import Request
+
+import responses
+from responses import json_response
+
+def make_request(**headers) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    })
+
+def content(retrieved_at: str = "2026-01-01T00:00:00") -> dict:
+    return {"messages": [{"id": f"m_{index}", "message": "Hello there"} for index in range(100)], "retrieved_at": retrieved_at}
+
+def test_etag_ignores_volatile_fields_and_body_keeps_them():
+    first = json_response(make_request(), content())
+    second = json_response(make_request(), content("2026-01-02T00:00:00"))
+    
+    assert first.headers["etag"] == second.headers["etag"]
+    assert json.loads(first.body) == content()
+    assert json.loads(second.body) == content("2026-01-02T00:00:00")
+
+def test_content_is_serialized_once(monkeypatch):
+    serialized = []
+    dumps = responses.dumps
+
+    def counting_dumps(value):
+        serialized.append(value)
+        return dumps(value)
+    
+    monkeypatch.setattr(responses, "dumps", counting_dumps)
+    json_response(make_request(accept_encoding="gzip"), content())
+    json_response(make_request(), {"data": [1, 2]})
+    
+    assert sum("messages" in value for value in serialized) == 1
+    assert sum("data" in value for value in serialized) == 1
+
+def test_matching_etag_answers_304():
+    etag = json_response(make_request(), content()).headers["etag"]
+    
+    response = json_response(make_request(if_none_match=etag), content("2026-01-02T00:00:00"))
+    assert response.status_code == 304
+    assert response.body == b""
+
+def test_large_bodies_are_gzipped_when_accepted():
+    response = json_response(make_request(accept_encoding="gzip"), content())
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.body)) == content()
+    
+    assert "content-encoding" not in json_response(make_request(), content()).headers
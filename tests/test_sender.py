@@ -0,0 +1,84 @@
+import httpx
+import pytest
+
+import sender
+from conftest import PAGE_ID
+
+def fail_first_send(monkeypatch, error: httpx.HTTPError):
+    """Make the first send raise error and later ones go to the fake Graph; returns the call list"""
+    calls = []
+    graph_post = sender.graph_post
+
+    async def flaky_graph_post(path, **kwargs):
+        calls.append(path)
+        if len(calls) == 1:
+            raise error
+        return await graph_post(path, **kwargs)
+    
+    monkeypatch.setattr(sender, "graph_post", flaky_graph_post)
+    monkeypatch.setattr(sender, "SEND_RETRY_BASE_DELAY", 0.01)
+    return calls
+
+def answer_first_send(monkeypatch, status_code: int, body):
+    """Answer the first send with a response and let later ones go to the fake Graph; returns the call list"""
+    calls = []
+    graph_post = sender.graph_post
+
+    async def flaky_graph_post(path, **kwargs):
+        calls.append(path)
+        if len(calls) == 1:
+            if isinstance(body, str):
+                return httpx.Response(status_code, text=body)
+            return httpx.Response(status_code, json=body)
+        return await graph_post(path, **kwargs)
+    
+    monkeypatch.setattr(sender, "graph_post", flaky_graph_post)
+    monkeypatch.setattr(sender, "SEND_RETRY_BASE_DELAY", 0.01)
+    return calls
+
+def send(client):
+    return client.post(f"/messages/{PAGE_ID}/send", json={"recipient_id": f"{PAGE_ID}000001", "message": "Hi"}).json()
+
+@pytest.mark.parametrize("error", [httpx.ReadTimeout("read timed out"), httpx.RemoteProtocolError("connection dropped")])
+def test_send_is_not_retried_once_graph_may_have_received_it(connected, monkeypatch, error):
+    calls = fail_first_send(monkeypatch, error)
+    
+    result = send(connected)
+    assert result["error"] == "Failed to send message"
+    assert result["attempts"] == 1
+    assert len(calls) == 1
+
+@pytest.mark.parametrize("error", [httpx.ConnectError("refused"), httpx.ConnectTimeout("connect timed out")])
+def test_send_is_retried_when_the_request_never_left(connected, monkeypatch, error):
+    calls = fail_first_send(monkeypatch, error)
+    
+    result = send(connected)
+    assert result["success"] is True
+    assert result["attempts"] == 2
+    assert len(calls) == 2
+
+@pytest.mark.parametrize("status_code, body", [
+    (502, "Bad Gateway"),
+    (504, "Gateway Timeout"),
+    (500, {"error": {"message": "An unknown error has occurred.", "code": 1}}),
+])
+def test_ambiguous_5xx_sends_are_not_retried(connected, monkeypatch, status_code, body):
+    calls = answer_first_send(monkeypatch, status_code, body)
+    
+    result = send(connected)
+    assert result["error"] == "Failed to send message"
+    assert result["attempts"] == 1
+    assert len(calls) == 1
+
+@pytest.mark.parametrize("status_code, body", [
+    (500, {"error": {"message": "Please retry your request later.", "code": 2, "is_transient": True}}),
+    (503, {"error": {"message": "Application request limit reached", "code": 4}}),
+    (429, "Too Many Requests"),
+])
+def test_transient_or_throttled_sends_are_retried(connected, monkeypatch, status_code, body):
+    calls = answer_first_send(monkeypatch, status_code, body)
+    
+    result = send(connected)
+    assert result["success"] is True
+    assert result["attempts"] == 2
+    assert len(calls) == 2
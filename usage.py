@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+from typing import Dict, Any, Mapping, Optional
+
+from config import USAGE_SLOWDOWN_THRESHOLD, USAGE_MAX_DELAY, USAGE_STALE_AFTER
+from metrics import Callback
+from deadline import remaining_time
+
+# Latest usage reported by Graph, as percentages of the allowed budget
+_app_usage: Dict[str, Any] = {}
+_page_usage: Dict[str, Dict[str, Any]] = {}
+_ad_account_usage: Dict[str, Dict[str, Any]] = {}
+_business_usage: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+throttle_stats = {"delays": 0, "delayed_seconds": 0.0}
+
+Callback("graph_app_usage_percent", "Highest app-level Graph usage percentage", lambda: usage_level())
+Callback(
+    "graph_throttle_delay_seconds_total",
+    "Time callers spent paused by the usage throttle",
+    lambda: throttle_stats["delayed_seconds"],
+    kind="counter"
+)
+
+def _parse_header(headers: Mapping[str, str], name: str) -> Optional[Any]:
+    """Parse a JSON usage header, ignoring malformed values"""
+    value = headers.get(name)
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+def record_usage(headers: Mapping[str, str], owner_id: Optional[str] = None):
+    """Record the usage headers of a Graph response
+    
+    X-App-Usage applies to the whole app. X-Page-Usage and
+    X-Ad-Account-Usage apply to the page or ad account the call was made
+    for (owner_id). X-Business-Use-Case-Usage names its objects itself.
+    """
+    now = time.time()
+    
+    app_usage = _parse_header(headers, "x-app-usage")
+    if isinstance(app_usage, dict):
+        _app_usage.clear()
+        _app_usage.update(app_usage, updated_at=now)
+    
+    page_usage = _parse_header(headers, "x-page-usage")
+    if isinstance(page_usage, dict) and owner_id:
+        _page_usage[owner_id] = {**page_usage, "updated_at": now}
+    
+    ad_account_usage = _parse_header(headers, "x-ad-account-usage")
+    if isinstance(ad_account_usage, dict) and owner_id:
+        _ad_account_usage[owner_id] = {**ad_account_usage, "updated_at": now}
+    
+    business_usage = _parse_header(headers, "x-business-use-case-usage")
+    if isinstance(business_usage, dict):
+        for object_id, use_cases in business_usage.items():
+            for use_case in use_cases or []:
+                _business_usage.setdefault(object_id, {})[use_case.get("type", "unknown")] = {
+                    **use_case, "updated_at": now
+                }
+
+def _percent(usage: Dict[str, Any]) -> float:
+    """Get the highest budget percentage in a usage entry, 0 when stale"""
+    if not usage or time.time() - usage.get("updated_at", 0) > USAGE_STALE_AFTER:
+        return 0.0
+    values = [
+        usage.get(name) or 0
+        for name in ("call_count", "total_time", "total_cputime", "acc_id_util_pct")
+    ]
+    return float(max(values))
+
+def _regain_seconds(usage: Dict[str, Any]) -> float:
+    """Get how long Graph says to wait before calling again, in seconds"""
+    if not usage or time.time() - usage.get("updated_at", 0) > USAGE_STALE_AFTER:
+        return 0.0
+    minutes = usage.get("estimated_time_to_regain_access") or 0
+    return float(minutes) * 60
+
+def usage_level(owner_id: Optional[str] = None) -> float:
+    """Get the highest budget percentage used by the app or an owner"""
+    entries = [_app_usage]
+    if owner_id:
+        entries.append(_page_usage.get(owner_id, {}))
+        entries.append(_ad_account_usage.get(owner_id, {}))
+        entries.extend(_business_usage.get(owner_id, {}).values())
+    return max(_percent(entry) for entry in entries)
+
+def throttle_delay(owner_id: Optional[str] = None) -> float:
+    """Get how long a caller should pause before its next Graph call
+    
+    Zero below USAGE_SLOWDOWN_THRESHOLD percent, then rising linearly to
+    USAGE_MAX_DELAY at 100 percent. When Graph reports a time to regain
+    access, that wait is used instead (capped at USAGE_MAX_DELAY).
+    """
+    if owner_id:
+        regain = max(
+            [_regain_seconds(entry) for entry in _business_usage.get(owner_id, {}).values()] or [0.0]
+        )
+        if regain:
+            return min(regain, USAGE_MAX_DELAY)
+    
+    level = usage_level(owner_id)
+    if level < USAGE_SLOWDOWN_THRESHOLD:
+        return 0.0
+    ratio = (level - USAGE_SLOWDOWN_THRESHOLD) / max(100 - USAGE_SLOWDOWN_THRESHOLD, 1)
+    return min(USAGE_MAX_DELAY, USAGE_MAX_DELAY * ratio)
+
+async def throttle(owner_id: Optional[str] = None):
+    """Pause before a Graph call when the usage budget is running low, at most until the current deadline"""
+    delay = throttle_delay(owner_id)
+    remaining = remaining_time()
+    if remaining is not None:
+        delay = min(delay, max(0.0, remaining))
+    if delay > 0:
+        throttle_stats["delays"] += 1
+        throttle_stats["delayed_seconds"] += delay
+        await asyncio.sleep(delay)
+
+def get_usage() -> Dict[str, Any]:
+    """Get the recorded usage and current budget levels"""
+    owner_ids = set(_page_usage) | set(_ad_account_usage) | set(_business_usage)
+    return {
+        "app": _app_usage,
+        "pages": _page_usage,
+        "ad_accounts": _ad_account_usage,
+        "business_use_cases": _business_usage,
+        "levels": {
+            "app": usage_level(),
+            **{owner_id: usage_level(owner_id) for owner_id in owner_ids}
+        },
+        "slowdown_threshold": USAGE_SLOWDOWN_THRESHOLD,
+        "throttle": throttle_stats
+    }
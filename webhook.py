@@ -1,8 +1,55 @@
-import json
+import asyncio
+import logging
+import time
 from fastapi import Request, HTTPException
-from typing import Dict, Any
+from typing import Dict, List, Any, Optional, Set, Tuple
 
-from config import WEBHOOK_VERIFY_TOKEN
+from config import (
+    WEBHOOK_VERIFY_TOKEN,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    WEBHOOK_BATCH_SIZE,
+    WEBHOOK_ENQUEUE_TIMEOUT,
+    LOG_PAYLOADS,
+)
+from models import page_exists
+from store import save_participant_message, format_graph_time
+from cache import graph_cache
+from leads import deliver_lead
+from live import publish_page_event
+from metrics import Callback
+from log import get_logger
+
+logger = get_logger("webhook")
+# Per-message logs, sampled at LOG_WEBHOOK_SAMPLE_RATE
+event_logger = get_logger("webhook.events")
+
+# Bounded queue of (enqueued_at, body) pairs drained by the webhook workers
+_queue: Optional["asyncio.Queue[Tuple[float, Dict[str, Any]]]"] = None
+_workers: List[asyncio.Task] = []
+
+# Leads being fetched for leadgen webhooks, outside the workers so retries don't stall the queue
+_lead_tasks: Set[asyncio.Task] = set()
+
+queue_stats = {
+    "received": 0,
+    "processed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "batches": 0,
+    "last_lag": 0.0,
+    "max_lag": 0.0
+}
+
+Callback("webhook_queue_depth", "Webhooks waiting for a worker", lambda: _queue.qsize() if _queue is not None else 0)
+Callback("webhook_queue_lag_seconds", "Queue wait of the last processed webhook", lambda: queue_stats["last_lag"])
+Callback(
+    "webhook_events_total",
+    "Webhooks by outcome",
+    lambda: {(name,): queue_stats[name] for name in ("received", "processed", "failed", "rejected")},
+    labelnames=("outcome",),
+    kind="counter"
+)
 
 async def verify_webhook(request: Request) -> int:
     """Verify Facebook webhook"""
@@ -10,39 +57,198 @@ async def verify_webhook(request: Request) -> int:
     token = request.query_params.get("hub.verify_token")
     challenge = request.query_params.get("hub.challenge")
     
-    print(f"🔍 Webhook verification: mode={mode}, token={token}")
-    
     if mode == "subscribe" and token == WEBHOOK_VERIFY_TOKEN:
-        print("✅ Webhook verified successfully!")
+        logger.info("Webhook verified")
         return int(challenge)
     else:
-        print("❌ Webhook verification failed!")
+        logger.warning("Webhook verification failed", extra={"mode": mode})
         raise HTTPException(status_code=403, detail="Forbidden")
 
 async def handle_webhook(request: Request) -> Dict[str, Any]:
-    """Handle incoming webhook messages"""
+    """Validate an incoming webhook and queue it for the workers
+
+    Responds as soon as the payload is queued. When the queue stays full
+    for WEBHOOK_ENQUEUE_TIMEOUT seconds the webhook is refused with a 503
+    so Facebook retries it later.
+    """
     try:
         body = await request.json()
-        print(f"\n📨 Webhook received: {json.dumps(body, indent=2)}")
+    except ValueError as e:
+        logger.warning("Webhook body is not JSON", extra={"error": str(e)})
+        return {"status": "ERROR", "message": str(e)}
+    
+    if not isinstance(body, dict) or not isinstance(body.get("entry", []), list):
+        return {"status": "ERROR", "message": "Invalid webhook payload"}
+    
+    queue_stats["received"] += 1
+    
+    # Without running workers (e.g. outside the app lifespan) process inline
+    if _queue is None:
+        await process_webhook_batch([(time.monotonic(), body)])
+        return {"status": "EVENT_RECEIVED"}
+    
+    try:
+        await asyncio.wait_for(_queue.put((time.monotonic(), body)), WEBHOOK_ENQUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        queue_stats["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Webhook queue full")
+    
+    return {"status": "EVENT_RECEIVED"}
+
+def start_webhook_workers():
+    """Create the webhook queue and start its workers"""
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+    for _ in range(WEBHOOK_WORKERS):
+        _workers.append(asyncio.create_task(webhook_worker(_queue)))
+
+async def stop_webhook_workers(timeout: float = 10.0):
+    """Drain queued webhooks for up to timeout seconds, then stop the workers"""
+    global _queue
+    if _queue is None:
+        return
+    
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Stopping with queued webhooks", extra={"queued": _queue.qsize()})
+    
+    if _lead_tasks:
+        _, pending = await asyncio.wait(set(_lead_tasks), timeout=timeout)
+        if pending:
+            logger.warning("Stopping with leads still being fetched", extra={"pending": len(pending)})
+    
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+def get_webhook_queue_stats() -> Dict[str, Any]:
+    """Get webhook queue depth, lag and counters"""
+    return {
+        "depth": _queue.qsize() if _queue is not None else 0,
+        "max_depth": WEBHOOK_QUEUE_SIZE,
+        "workers": len(_workers),
+        "leads_in_flight": len(_lead_tasks),
+        **queue_stats
+    }
+
+async def webhook_worker(queue: "asyncio.Queue[Tuple[float, Dict[str, Any]]]"):
+    """Drain the webhook queue in batches of up to WEBHOOK_BATCH_SIZE"""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < WEBHOOK_BATCH_SIZE:
+            try:
+                batch.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
         
-        # Process webhook data
-        if body.get("object") == "page":
-            for entry in body.get("entry", []):
-                page_id = entry.get("id")
+        try:
+            await process_webhook_batch(batch)
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+async def process_webhook_batch(batch: List[Tuple[float, Dict[str, Any]]]):
+    """Process a batch of queued webhook payloads"""
+    queue_stats["batches"] += 1
+    for enqueued_at, body in batch:
+        lag = time.monotonic() - enqueued_at
+        queue_stats["last_lag"] = lag
+        queue_stats["max_lag"] = max(queue_stats["max_lag"], lag)
+        
+        try:
+            await process_webhook_event(body)
+            queue_stats["processed"] += 1
+        except Exception as e:
+            queue_stats["failed"] += 1
+            logger.exception("Webhook processing error", extra={"error": str(e)})
+
+async def process_webhook_event(body: Dict[str, Any]):
+    """Handle one webhook payload"""
+    if LOG_PAYLOADS and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Webhook payload", extra={"payload": body})
+    
+    # Process webhook data
+    if body.get("object") == "page":
+        for entry in body.get("entry", []):
+            page_id = entry.get("id")
+            
+            # Anything cached for this page may now be stale
+            graph_cache.invalidate_tag(page_id)
+            
+            # Handle messages
+            for messaging in entry.get("messaging", []):
+                sender_id = messaging.get("sender", {}).get("id")
+                message_data = messaging.get("message", {})
                 
-                # Handle messages
-                for messaging in entry.get("messaging", []):
-                    sender_id = messaging.get("sender", {}).get("id")
-                    message_data = messaging.get("message", {})
+                if message_data:
+                    event_logger.info(
+                        "New message",
+                        extra={"page_id": page_id, "sender_psid": sender_id, "mid": message_data.get("mid")}
+                    )
                     
-                    if message_data:
-                        message_text = message_data.get("text", "No text")
-                        print(f"💬 New message from {sender_id} to page {page_id}")
-                        print(f"Message: {message_text}")
-                        print(f"🆔 Sender PSID: {sender_id} (use this for replies)")
-        
-        return {"status": "EVENT_RECEIVED"}
+                    if page_exists(page_id):
+                        store_webhook_message(page_id, messaging)
+            
+            # Handle new leads
+            for change in entry.get("changes", []):
+                if change.get("field") == "leadgen":
+                    schedule_lead_delivery(page_id, change.get("value", {}))
+
+def schedule_lead_delivery(page_id: str, value: Dict[str, Any]):
+    """Start fetching the lead announced by a leadgen change"""
+    leadgen_id = value.get("leadgen_id")
+    if not leadgen_id:
+        return
     
-    except Exception as e:
-        print(f"❌ Webhook processing error: {str(e)}")
-        return {"status": "ERROR", "message": str(e)}
+    page_id = str(value.get("page_id") or page_id)
+    form_id = str(value["form_id"]) if value.get("form_id") else None
+    event_logger.info("New lead", extra={"page_id": page_id, "leadgen_id": leadgen_id, "form_id": form_id})
+    
+    task = asyncio.create_task(deliver_lead(page_id, str(leadgen_id), form_id))
+    _lead_tasks.add(task)
+    task.add_done_callback(_lead_delivery_done)
+
+def _lead_delivery_done(task: asyncio.Task):
+    """Forget a finished lead fetch, logging it if it crashed"""
+    _lead_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Lead delivery error", exc_info=task.exception())
+
+def store_webhook_message(page_id: str, messaging: Dict[str, Any]):
+    """Persist a Messenger message event into the local store and push it to live subscribers"""
+    message_data = messaging.get("message", {})
+    if not message_data.get("mid"):
+        return
+    
+    sender_id = messaging.get("sender", {}).get("id")
+    recipient_id = messaging.get("recipient", {}).get("id")
+    # Echoes are messages the page sent, so the participant is the recipient
+    psid = recipient_id if message_data.get("is_echo") else sender_id
+    created_time = format_graph_time(messaging.get("timestamp"))
+    
+    inserted = save_participant_message(
+        page_id,
+        psid,
+        message_data["mid"],
+        created_time,
+        {"id": sender_id},
+        {"data": [{"id": recipient_id}]},
+        message_data.get("text")
+    )
+    
+    # Redeliveries and echoes of our own sends are already stored and were already pushed
+    if inserted:
+        publish_page_event(page_id, "message", {
+            "message_id": message_data["mid"],
+            "participant_psid": psid,
+            "created_time": created_time,
+            "from": {"id": sender_id},
+            "to": {"data": [{"id": recipient_id}]},
+            "message": message_data.get("text"),
+            "is_echo": bool(message_data.get("is_echo"))
+        })